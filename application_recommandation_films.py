@@ -1,12 +1,21 @@
-import pandas as pd
-import re
-import numpy as np
 import streamlit as st
-import requests
-from sklearn.metrics.pairwise import cosine_similarity
-from datetime import datetime
 from dotenv import load_dotenv
 import os
+import requests
+
+from artefact import ouvrir_metadonnees, version_actuelle
+from cache_tmdb import CacheTMDB
+from donnees import (
+    DUREE_VALIDITE_SOURCE, charger_catalogue, charger_metadonnees, cle_catalogue, download_url, est_url,
+    telecharger_source,
+)
+from genres import BitmapsGenres
+from index_titres import IndexTitres
+from recherche import RechercheTitres
+from metriques import PORT_PROMETHEUS, demarrer_exportateur, etape, mesurer_memoire, registre, trace
+from recommandation import FilmInconnu, Recommandeur
+from service import ClientService
+from tmdb import ClientTMDB
 
 load_dotenv()
 
@@ -18,170 +27,144 @@ st.set_page_config(
     initial_sidebar_state="expanded"  # La sidebar sera toujours affichée au départ
 )
 
-# Lien partie 1
-url = "https://drive.google.com/file/d/1d667eGYQCc_LGMiX3OJhhMiuFyiKCzih/view?usp=drive_link"
-
-# Regex pour récupérer le lien URL
-pattern = r"https://drive.google.com/file/d/([a-zA-Z0-9_-]+)/view\?usp=drive_link"
-
-# Utilisation de re.search pour trouver l'ID du fichier
-match = re.search(pattern, url)
-
-file_id = match.group(1)
-# Créer l'URL de téléchargement direct avec l'ID extrait
-download_url = f"https://drive.google.com/uc?id={file_id}"
-
-# Charger le fichier CSV depuis l'URL de téléchargement direct
-def charger_donnees():
-    return pd.read_csv(download_url, delimiter="\t")
-
-df = charger_donnees()
-
-# URL de base pour les affiches
-url_image_base = "https://image.tmdb.org/t/p/w600_and_h900_bestv2"
+# Chargement du catalogue : artefact précalculé si DECODEX_ARTEFACT est défini
+# (voir artefact.py), sinon TSV distant (ou fichier local DECODEX_SOURCE) lu via le cache local
+dossier_artefact = os.getenv("DECODEX_ARTEFACT")
+source_catalogue = os.getenv("DECODEX_SOURCE", download_url)
 
 # Clé API TMDB
 api_key = os.getenv("TMDB_API_KEY")
 
-# Créer la colonne "Lien" en concaténant l'URL de base et la colonne "Affiche"
-df["Lien"] = url_image_base + df["Affiche"]
-
-# Pondération des colonnes
-poids = {
-    "Note_moyenne": 5, "Nb_votants": 5, "Annee_sortie": 5, "Duree_minutes": 5,
-    "Film": 5, "Court_metrage": 5,
-    "Comedie": 10, "Documentaire": 10, "Famille": 10, "Romance": 10,
-    "DIR_": 20, "ACT_": 25  # Poids pour les colonnes des directeurs et acteurs
-}
-
-# Appliquer les pondérations
-for col in df.columns:
-    if col in poids:  # Pondération des colonnes générales
-        df[col] = df[col] * poids[col]
-    elif col.startswith("DIR_"):  # Pondération des colonnes des directeurs
-        df[col] = df[col] * poids["DIR_"]
-    elif col.startswith("ACT_"):  # Pondération des colonnes des acteurs
-        df[col] = df[col] * poids["ACT_"]
-
-# Sélection des colonnes numériques pour la similarité
-features = df.select_dtypes(include=[np.number])
-
-# Calcul de la similarité cosinus
-cos_sim = cosine_similarity(features)
-
-# Fonction de recommandation
-def recommander_films(titre, n):
-    try:
-        # Récupérer l'index du film
-        film_index = df[df["Titre_original"] == titre].index[0]
-
-        # Obtenir les similarités cosinus et trier
-        similarites = cos_sim[film_index]
-        indices_similaires = np.argsort(similarites)[-n-1:-1][::-1]  # Top-n films similaires
-
-        # Retourner les titres et les distances
-        return [
-            (df.iloc[i]["Titre_original"], df.iloc[i]["Lien"], df.iloc[i]["ID_film"]) for i in indices_similaires
-        ]
-    except IndexError:
-        return f"Corrige le titre de ton film !"
-
-# Fonction pour formater la date au format "JJ/MM/AAAA"
-def formater_date(date_str):
-    try:
-        # Convertir la chaîne de date en objet datetime
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        # Formater la date en "JJ/MM/AAAA"
-        return date_obj.strftime("%d/%m/%Y")  # Format : 06/02/2019
-    except ValueError:
-        return date_str  # Retourner la date telle quelle si la conversion échoue
-
-def obtenir_details_tmdb(film_id):
-    try:
-        if not api_key:
-            raise ValueError("Clé API manquante")
-
-        url = f"https://api.themoviedb.org/3/movie/{film_id}?api_key={api_key}&language=fr"
-        response = requests.get(url)
-
-        if response.status_code != 200:
-            raise ValueError(f"Erreur TMDB (film): {response.status_code}")
-
-        data = response.json()
-        duree = data.get("runtime", "N/A")
-        genres = [genre["name"] for genre in data.get("genres", [])]
-        synopsis = data.get("overview", "Aucun synopsis disponible.")
-        date_sortie = data.get("release_date", "N/A")
-        date_sortie_formatee = formater_date(date_sortie)
-
-        acteurs = obtenir_acteurs(film_id)
-        video_url = obtenir_video_youtube(film_id)
-
-        # Récupérer le nom du réalisateur
-        equipe_url = f"https://api.themoviedb.org/3/movie/{film_id}/credits?api_key={api_key}&language=fr"
-        equipe_response = requests.get(equipe_url)
-        if equipe_response.status_code == 200:
-            equipe_data = equipe_response.json()
-            directeur = next((m["name"] for m in equipe_data["crew"] if m["job"] == "Director"), "Inconnu")
+# Précision des vecteurs (float64, float32, float16, int8) : voir `python stockage.py` pour comparer
+precision = os.getenv("PRECISION", "float64")
+
+# K_VOISINS > 0 précalcule et conserve uniquement les K plus proches voisins de chaque film
+k_voisins = int(os.getenv("K_VOISINS", "0")) or None
+
+# Index approché optionnel (ANN_LISTES > 0) : ANN_SONDES règle le compromis rappel/latence
+ann_listes = int(os.getenv("ANN_LISTES", "0"))
+ann_sondes = int(os.getenv("ANN_SONDES", "8"))
+
+# Service de recommandation optionnel (voir service.py) : recommandations et détails TMDB lui sont
+# demandés, le catalogue local ne sert plus qu'à la recherche de titres et au filtre des genres
+url_service = os.getenv("DECODEX_SERVICE")
+if url_service:
+    k_voisins, ann_listes = None, 0
+
+# Instrumentation (voir metriques.py) : panneau de débogage sous les résultats avec DECODEX_DEBUG=1,
+# exportateur Prometheus avec DECODEX_METRIQUES_PORT, profils cProfile avec DECODEX_PROFIL
+mode_debug = os.getenv("DECODEX_DEBUG", "0") != "0"
+
+@st.cache_resource
+def exportateur_metriques(port):
+    return demarrer_exportateur(port)
+
+if PORT_PROMETHEUS:
+    exportateur_metriques(PORT_PROMETHEUS)
+
+
+# Revalidation de la source distante, seule à expirer : requête conditionnelle (sans retéléchargement
+# si la source n'a pas changé) et clé du cache du catalogue, qui ne change qu'avec le contenu du TSV
+@st.cache_data(show_spinner=False, ttl=DUREE_VALIDITE_SOURCE)
+def revalider_source(source_catalogue):
+    return cle_catalogue(telecharger_source(source_catalogue))
+
+
+# Version des données servies : change dès qu'une nouvelle version d'artefact est publiée,
+# que le fichier TSV local est modifié ou que le contenu de la source distante change,
+# ce qui invalide les caches Streamlit ci-dessous
+def version_donnees():
+    if dossier_artefact:
+        return version_actuelle(dossier_artefact)
+    if est_url(source_catalogue):
+        return revalider_source(source_catalogue)
+    return str(os.stat(source_catalogue).st_mtime_ns)
+
+
+# État lourd partagé par toutes les sessions et conservé entre les reruns : catalogue,
+# index des titres, moteur de similarité, bitsets des genres et index de recherche.
+# Avec un service de recommandation, seuls les titres et les genres sont chargés (pas de moteur).
+# `version` ne sert qu'à la clé du cache : une seule entrée est gardée, l'état d'une version
+# remplacée est libéré dès que la nouvelle est chargée.
+@st.cache_resource(show_spinner="Chargement du catalogue…", max_entries=1)
+def charger_ressources(dossier_artefact, source_catalogue, precision, k_voisins, ann_listes, ann_sondes, version, url_service):
+    recommandeur = None
+    if url_service:
+        # Métadonnées seules : ni vecteurs ni features, les recommandations sont demandées au service
+        if dossier_artefact:
+            df, index_titres = ouvrir_metadonnees(dossier_artefact)
         else:
-            directeur = "Inconnu"
-
-        note = data.get("vote_average", 0.0)
-        budget = data.get("budget", 0)
-        revenu = data.get("revenue", 0)
-
-        return duree, genres, synopsis, date_sortie_formatee, acteurs, video_url, directeur, note, budget, revenu
-
-    except Exception as e:
-        return (
-            "N/A",                # duree
-            [],                   # genres
-            f"Erreur : {e}",      # synopsis
-            "N/A",                # date_sortie
-            [],                   # acteurs
-            None,                 # video_url
-            "Inconnu",            # directeur
-            0.0,                  # note
-            0,                    # budget
-            0                     # revenu
-        )
+            df = charger_metadonnees(source_catalogue)
+            index_titres = IndexTitres(df)
+    else:
+        if dossier_artefact:
+            # Tableaux ouverts en mémoire partagée (mmap) : les processus se partagent les pages
+            recommandeur = Recommandeur.depuis_artefact(dossier_artefact, precision=precision)
+        else:
+            # Moteur de similarité cosinus sur la matrice creuse des colonnes pondérées par `poids`
+            df, features, colonnes = charger_catalogue(source_catalogue)
+            recommandeur = Recommandeur.depuis_catalogue(
+                df, k_voisins=k_voisins, features=features, precision=precision, colonnes=colonnes
+            )
+        if ann_listes:
+            recommandeur.moteur.construire_index_approx(nb_listes=ann_listes, nb_sondes=ann_sondes)
+        mesurer_memoire(recommandeur)
+        df, index_titres = recommandeur.df, recommandeur.index_titres
+    # Appartenance aux genres en bitsets précalculés (filtre de la sidebar et recommandations filtrées)
+    bitmaps_genres = BitmapsGenres(df)
+    # Recherche de titres (préfixe + trigrammes, sans accents ni casse) pour le sélecteur de la sidebar
+    recherche_titres = RechercheTitres(index_titres.libelles)
+    return recommandeur, index_titres, bitmaps_genres, recherche_titres
+
+
+version = version_donnees()
+# Index des titres : libellé (titre désambiguïsé par année/ID_film) → position
+recommandeur, index_titres, bitmaps_genres, recherche_titres = charger_ressources(
+    dossier_artefact, source_catalogue, precision, k_voisins, ann_listes, ann_sondes, version, url_service
+)
 
+# Fonction de recommandation, mise en cache par (titre, n, genres, reclassement) pour une version donnée des données :
+# les reruns purement visuels (taille du texte, mise en page, éléments affichés) ne recalculent rien.
+# Une erreur réseau du service est levée (donc jamais mise en cache) et affichée par l'appelant
+@st.cache_data(show_spinner=False, max_entries=1024)
+def recommander_films(titre, n, genres=None, version=None, poids=None, diversite=0.0):
+    if url_service:
+        try:
+            return client_service.recommander(titre, n, genres=genres, poids=poids, diversite=diversite)
+        except FilmInconnu:
+            return f"Corrige le titre de ton film !"
+    masque = bitmaps_genres.masque(bitmaps_genres.union(genres)) if genres is not None else None
+    try:
+        # Top-n films similaires (le film lui-même est exclu) : titres, affiches et identifiants
+        return recommandeur.recommander(titre, n, masque=masque, poids=poids, diversite=diversite)
+    except FilmInconnu:
+        return f"Corrige le titre de ton film !"
 
+# Client TMDB partagé : pool de connexions, un seul appel par film, requêtes en parallèle,
+# réponses conservées dans un cache mémoire + SQLite commun à tous les processus
+@st.cache_resource
+def creer_client_tmdb(api_key, timeout, nb_essais, facteur_attente):
+    return ClientTMDB(api_key, timeout=timeout, nb_essais=nb_essais, facteur_attente=facteur_attente, cache=CacheTMDB())
+
+@st.cache_resource
+def creer_client_service(url_service):
+    return ClientService(url_service)
+
+if url_service:
+    # Même interface que ClientTMDB (details, details_lot, details_au_fil)
+    client_service = client_tmdb = creer_client_service(url_service)
+else:
+    client_tmdb = creer_client_tmdb(
+        api_key,
+        timeout=float(os.getenv("TMDB_TIMEOUT", "10")),
+        nb_essais=int(os.getenv("TMDB_ESSAIS", "3")),
+        facteur_attente=float(os.getenv("TMDB_ATTENTE", "0.5")),
+    )
 
-        # Récupérer la note du film
-        note = data.get("vote_average", "N/A")  # Si pas de note, on met "N/A"
-        
-        # Récupérer le budget et les revenus
-        budget = data.get("budget", 0)  # Le budget peut être nul, donc mettre 0 si indisponible
-        revenu = data.get("revenue", 0)  # Le revenu peut aussi être nul, donc mettre 0 si indisponible
-        
-        return duree, genres, synopsis, date_sortie_formatee, acteurs, video_url, directeur, note, budget, revenu
-    else:
-        return "N/A", [], "Aucun détail disponible.", "N/A", [], None, "Inconnu"  # Ajouter "Inconnu" pour le directeur en cas d'erreur
-
-# Fonction pour obtenir les acteurs du film via l'API TMDB
-def obtenir_acteurs(film_id):
-    url = f"https://api.themoviedb.org/3/movie/{film_id}/credits?api_key={api_key}&language=fr"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        acteurs = [acteur["name"] for acteur in data.get("cast", [])][:5]  # Limiter à X acteurs principaux
-        return acteurs
-    return []  # Si aucun acteur n'est trouvé, retourner une liste vide
-
-# Fonction pour obtenir l'URL de la vidéo YouTube
-def obtenir_video_youtube(film_id):
-    url = f"https://api.themoviedb.org/3/movie/{film_id}/videos?api_key={api_key}&language=fr"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        if data["results"]:
-            # Utilisation de la première vidéo disponible
-            video_key = data["results"][0]["key"]
-            return f"https://www.youtube.com/watch?v={video_key}"
-        else:
-            return None  # Aucun vidéo trouvée
-    return None  # Erreur lors de la récupération des vidéos
+# Détails TMDB déjà récupérés dans la session : réutilisés tels quels lors des reruns
+# (seuls les détails effectivement obtenus sont conservés, un échec est retenté au rerun suivant)
+if "details_tmdb" not in st.session_state:
+    st.session_state.details_tmdb = {}
 
 # Initialisation de la taille du texte avec un état par défaut
 if "taille_texte" not in st.session_state:
@@ -224,60 +207,46 @@ with st.sidebar:
             show_famille = st.checkbox("Famille", value=True)
             show_romance = st.checkbox("Romance", value=True)
 
-        # Créer un masque pour chaque genre
-        masque = []
-        if show_comedie:
-            masque.append(df["Comedie"] !=0)
-        if show_documentaire:
-            masque.append(df["Documentaire"] !=0)
-        if show_famille:
-            masque.append(df["Famille"] !=0)
-        if show_romance:
-            masque.append(df["Romance"] !=0)
-
-        # Appliquer le masque sur le dataframe : cela signifie que l'on filtre les lignes qui correspondent à l'un des genres sélectionnés
-        if masque:
-            filtre = masque[0]
-            for m in masque[1:]:
-                filtre = filtre | m  # Utiliser 'ou' logique pour combiner les filtres
-
-            # Filtrer le dataframe selon le masque combiné
-            df_filtre = df[filtre]
-
-            # Créer une liste des titres correspondant au genre sélectionné
-            liste_titres = df_filtre["Titre_original"].tolist()
-        else:
-            liste_titres = []  # Si aucun genre n'est sélectionné, la liste est vide
+        # Combiner les genres sélectionnés par un 'ou' logique sur les bitsets précalculés
+        genres_choisis = [
+            genre for genre, choisi in (
+                ("Comedie", show_comedie), ("Documentaire", show_documentaire),
+                ("Famille", show_famille), ("Romance", show_romance),
+            ) if choisi
+        ]
+        bitset_genres = bitmaps_genres.union(genres_choisis)
+        filtre = bitmaps_genres.masque(bitset_genres)
 
-    # Afficher la liste des titres filtrés
-    st.write(f"Films dans la base de données : {len(liste_titres)}")
+        # Restreindre aussi les recommandations aux genres choisis
+        filtrer_recommandations = st.checkbox("Recommander uniquement ces genres", value=False)
 
-    liste_titres.sort()  # Tri alphabétique de la liste
-    # Vérifier le nombre de films dans la liste
-    if len(liste_titres) == 0:
+    # Afficher le nombre de titres filtrés
+    nb_films_filtres = bitmaps_genres.compter(bitset_genres)
+    st.write(f"Films dans la base de données : {nb_films_filtres}")
+
+    # Vérifier le nombre de films retenus
+    if nb_films_filtres == 0:
         st.error("Aucun film ne correspond aux filtres actuels.")
         st.stop()  # Arrêter l'exécution si aucun film n'est trouvé
 
-    else:
-        liste_titres.sort()  # Tri alphabétique de la liste
-        # Sélectionner un film sans valeur par défaut
-    if len(liste_titres) == 0:
-        st.stop()  # Arrêter l'exécution si aucun film n'est dans la liste
-
-    liste_titres.insert(0, "")
-    titre_film = st.selectbox("**Entrez le titre du film :**", liste_titres)
+    # Recherche incrémentale : seules les meilleures correspondances sont envoyées au sélecteur
+    saisie = st.text_input("**Entrez le titre du film :**", placeholder="Tapez le début du titre…")
+    suggestions = recherche_titres.suggestions(saisie, masque=filtre, limite=50)
+    if saisie and not suggestions:
+        st.warning("Aucun titre ne correspond à votre saisie.")
+    titre_film = st.selectbox("**Choisissez le film :**", [""] + suggestions)
 
     # Vérifier si un film a été sélectionné
     if titre_film == "":
         st.stop()  # Arrêter l'exécution si aucun film n'est sélectionné
     else:
-        film_saisi = df[df["Titre_original"] == titre_film]
+        position_film = index_titres.position(titre_film)
         with st.expander("Affiche du Film choisi", expanded=True):
 
             # Affichage de l'image du film (colonne 'lien' contenant l'URL de l'image)
             if titre_film:
                 try:
-                    image_url = df[df["Titre_original"] == titre_film]["Lien"].values[0]
+                    image_url = index_titres.liens[position_film]
                     st.markdown(f"<div style='text-align:center; font-size:{st.session_state.taille_texte}px;'></div>", unsafe_allow_html=True)
                     st.markdown(f"""
                         <style>
@@ -348,6 +317,22 @@ with st.sidebar:
             # )
 
                 
+        # Reclassement des candidats (voir reclassement.py) : poids choisis à chaque requête, sans recalcul des similarités
+        with st.sidebar.expander("Affiner le classement", expanded=False):
+            poids_popularite = st.slider("Popularité", min_value=0.0, max_value=1.0, value=0.0, step=0.05)
+            poids_note = st.slider("Note moyenne", min_value=0.0, max_value=1.0, value=0.0, step=0.05)
+            poids_recence = st.slider("Films récents", min_value=0.0, max_value=1.0, value=0.0, step=0.05)
+            poids_genres = st.slider("Mêmes genres", min_value=0.0, max_value=1.0, value=0.0, step=0.05)
+            diversite = st.slider("Diversité des résultats", min_value=0.0, max_value=0.9, value=0.0, step=0.1)
+
+            poids_reclassement = {
+                "popularite": poids_popularite, "note": poids_note,
+                "recence": poids_recence, "genres": poids_genres,
+            }
+            # Sans poids ni diversité : classement cosinus d'origine
+            if not any(poids_reclassement.values()):
+                poids_reclassement = None
+
         # Afficher la taille actuelle en pixels
         with st.sidebar.expander("Accessibilité", expanded=False):
              # Utilisation de checkbox pour simuler un toggle
@@ -374,8 +359,68 @@ with st.sidebar:
             # Limiter la taille du texte pour éviter des valeurs trop petites ou trop grandes
             st.session_state.taille_texte = max(10, min(st.session_state.taille_texte, 30))  # Plage de 10 à 30
 
+# Carte d'un film, rendue avec les options d'affichage courantes à partir de détails déjà récupérés
+def afficher_carte(film_titre, film_image, details):
+    duree, genres, synopsis, date_sortie, acteurs, video_url, directeur, note, budget, revenu = details
+
+    st.markdown(f"<div style='font-size:{st.session_state.taille_texte + 4}px; text-align: center; font-weight: bold;'>{film_titre}</div>", unsafe_allow_html=True)
+
+    # Affichage conditionnel de l'image du film
+    if show_image:
+        st.markdown(
+            f"""
+            <div style="display: flex; justify-content: center; align-items: center; 
+                        width: 100%; margin: auto;">
+                <img src="{film_image}" style="max-height: 400px; border: 1px solid black; border-radius: 8px; object-fit: cover;">
+            </div>
+            """, 
+            unsafe_allow_html=True
+        )
+
+    # Ajout d'un espace de 20px après l'image
+    st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
+
+    # Affichage conditionnel de la vidéo YouTube
+    if show_video and video_url:
+        st.video(video_url)
+    elif show_video:
+        st.warning("Aucune vidéo disponible pour ce film.")
+
+    # Affichage conditionnel des autres informations
+    if show_realisateur:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Réalisateur :</u> </strong>{directeur}</div>""", unsafe_allow_html=True)
+    if show_date_sortie:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Date de sortie :</u> </strong>{date_sortie}</div>""", unsafe_allow_html=True)
+    if show_duree:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Durée :</u> </strong>{duree} minutes</div>""", unsafe_allow_html=True)
+    if show_genres:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Genres :</u> </strong>{', '.join(genres)}</div>""", unsafe_allow_html=True)
+    if show_acteurs and acteurs:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Acteurs :</u> </strong>{', '.join(acteurs)}</div>""", unsafe_allow_html=True)
+    if show_note:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Note moyenne :</u> </strong>{note:.1f}/10</div>""", unsafe_allow_html=True)
+    if show_budget and budget > 0:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Budget :</u> </strong>{budget:,.0f} $</div>""", unsafe_allow_html=True)
+    if show_revenu and revenu > 0:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Revenus :</u> </strong>{revenu:,.0f} $</div>""", unsafe_allow_html=True)    
+    if show_synopsis:
+        st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Synopsis :</u> </strong></div>""", unsafe_allow_html=True)
+        st.markdown(f"""
+        <div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px; text-align: justify;">
+        {synopsis}
+        </div>
+        """, unsafe_allow_html=True)
+
 if titre_film:
-    films_similaires = recommander_films(titre_film, n_similaire)
+    genres_filtres = tuple(genres_choisis) if filtrer_recommandations else None
+    # Étapes détaillées (titre, similarité, lecture des résultats) mesurées seulement hors cache Streamlit
+    with trace("recommandation") as trace_recommandation:
+        try:
+            films_similaires = recommander_films(
+                titre_film, n_similaire, genres_filtres, version, poids=poids_reclassement, diversite=diversite
+            )
+        except requests.RequestException as e:
+            films_similaires = f"Service de recommandation indisponible : {e}"
     if isinstance(films_similaires, str):
         st.error(films_similaires)
     else:
@@ -396,71 +441,81 @@ if titre_film:
         st.markdown("<div style='height: 30px;'></div>", unsafe_allow_html=True)
 
         # Calcul du nombre de lignes nécessaires en fonction du nombre de films par ligne (n_par_ligne)
-        lignes = (n_similaire // n_par_ligne) + (1 if n_similaire % n_par_ligne != 0 else 0)
+        # (le filtre par genre peut renvoyer moins de films que demandé)
+        nb_resultats = len(films_similaires)
+        lignes = (nb_resultats // n_par_ligne) + (1 if nb_resultats % n_par_ligne != 0 else 0)
 
-        # Affichage des films similaires en utilisant st.columns, avec un nombre fixe de colonnes (n_par_ligne)
+        # Grille de n_par_ligne colonnes fixes : un emplacement par film, rempli dès que ses détails sont connus
+        emplacements = []
         for i in range(lignes):
-            # Création des colonnes pour cette ligne avec n_par_ligne colonnes fixes
             cols = st.columns(n_par_ligne)
-
-            # Affichage des films sur cette ligne
             for j in range(n_par_ligne):
-                index = i * n_par_ligne + j
-                if index < n_similaire:  # On vérifie qu'il y a encore des films à afficher
-                    film_titre, film_image, film_id = films_similaires[index]
-
+                if i * n_par_ligne + j < nb_resultats:  # On vérifie qu'il y a encore des films à afficher
                     with cols[j]:
-                        # Récupérer les détails du film
-                        duree, genres, synopsis, date_sortie, acteurs, video_url, directeur, note, budget, revenu = obtenir_details_tmdb(film_id)
-
-                        st.markdown(f"<div style='font-size:{st.session_state.taille_texte + 4}px; text-align: center; font-weight: bold;'>{film_titre}</div>", unsafe_allow_html=True)
-
-                        # Affichage conditionnel de l'image du film
-                        if show_image:
-                            st.markdown(
-                                f"""
-                                <div style="display: flex; justify-content: center; align-items: center; 
-                                            width: 100%; margin: auto;">
-                                    <img src="{film_image}" style="max-height: 400px; border: 1px solid black; border-radius: 8px; object-fit: cover;">
-                                </div>
-                                """, 
-                                unsafe_allow_html=True
-                            )
-
-                        # Ajout d'un espace de 20px après l'image
-                        st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
-
-                        # Affichage conditionnel de la vidéo YouTube
-                        if show_video and video_url:
-                            st.video(video_url)
-                        elif show_video:
-                            st.warning("Aucune vidéo disponible pour ce film.")
-
-                        # Affichage conditionnel des autres informations
-                        if show_realisateur:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Réalisateur :</u> </strong>{directeur}</div>""", unsafe_allow_html=True)
-                        if show_date_sortie:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Date de sortie :</u> </strong>{date_sortie}</div>""", unsafe_allow_html=True)
-                        if show_duree:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Durée :</u> </strong>{duree} minutes</div>""", unsafe_allow_html=True)
-                        if show_genres:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Genres :</u> </strong>{', '.join(genres)}</div>""", unsafe_allow_html=True)
-                        if show_acteurs and acteurs:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Acteurs :</u> </strong>{', '.join(acteurs)}</div>""", unsafe_allow_html=True)
-                        if show_note:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Note moyenne :</u> </strong>{note:.1f}/10</div>""", unsafe_allow_html=True)
-                        if show_budget and budget > 0:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Budget :</u> </strong>{budget:,.0f} $</div>""", unsafe_allow_html=True)
-                        if show_revenu and revenu > 0:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Revenus :</u> </strong>{revenu:,.0f} $</div>""", unsafe_allow_html=True)    
-                        if show_synopsis:
-                            st.markdown(f"""<div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px;"><strong><u>Synopsis :</u> </strong></div>""", unsafe_allow_html=True)
-                            st.markdown(f"""
-                            <div style="font-size:{st.session_state.taille_texte}px; margin-bottom: 10px; text-align: justify;">
-                            {synopsis}
-                            </div>
-                            """, unsafe_allow_html=True)
+                        emplacements.append(st.empty())
 
             # Si ce n'est pas la dernière ligne, ajouter une bordure
             if i < lignes - 1:
                 st.markdown("<div style='border-top: 5px solid black;'></div>", unsafe_allow_html=True)
+
+        # Films dont les détails sont déjà dans la session : rendus immédiatement, sans appel réseau
+        with trace("cartes") as trace_cartes:
+            details_session = st.session_state.details_tmdb
+            a_charger = []
+            for index, (film_titre, film_image, film_id) in enumerate(films_similaires):
+                if film_id in details_session:
+                    with etape("rendu_carte"), emplacements[index].container():
+                        afficher_carte(film_titre, film_image, details_session[film_id])
+                else:
+                    emplacements[index].info("Chargement des détails…")
+                    a_charger.append(index)
+
+            # Autres films : détails TMDB récupérés en parallèle, chaque carte est rendue dès sa réponse
+            ids_a_charger = [films_similaires[index][2] for index in a_charger]
+            arrivees = client_tmdb.details_au_fil(ids_a_charger)
+            while True:
+                with etape("attente_tmdb"):
+                    arrivee = next(arrivees, None)
+                if arrivee is None:
+                    break
+                position, details, disponible = arrivee
+                index = a_charger[position]
+                film_titre, film_image, film_id = films_similaires[index]
+                if disponible:
+                    details_session[film_id] = details
+                with etape("rendu_carte"), emplacements[index].container():
+                    afficher_carte(film_titre, film_image, details)
+
+        # Panneau de débogage (DECODEX_DEBUG=1) : décomposition de la requête, compteurs et mémoire
+        if mode_debug:
+            with st.expander("🛠 Débogage", expanded=False):
+                st.markdown("**Durée par étape (ms)**")
+                durees = {}
+                for trace_page in (trace_recommandation, trace_cartes):
+                    durees[trace_page.nom] = 1000 * trace_page.duree
+                    for nom, duree in trace_page.etapes:
+                        durees[f"{trace_page.nom} › {nom}"] = durees.get(f"{trace_page.nom} › {nom}", 0) + 1000 * duree
+                st.table({"étape": list(durees), "durée (ms)": [f"{duree:.2f}" for duree in durees.values()]})
+
+                st.markdown("**TMDB**")
+                st.write({
+                    "appels réseau": registre.valeur("decodex_tmdb_appels_total"),
+                    "erreurs": registre.valeur("decodex_tmdb_erreurs_total"),
+                    "relances": registre.valeur("decodex_tmdb_relances_total"),
+                    "cache frais": registre.valeur("decodex_tmdb_cache_total", etat="frais"),
+                    "cache périmé": registre.valeur("decodex_tmdb_cache_total", etat="perime"),
+                    "cache absent": registre.valeur("decodex_tmdb_cache_total", etat="absent"),
+                    "détails déjà dans la session": len(films_similaires) - len(a_charger),
+                })
+
+                st.markdown("**Mémoire (Mo)**")
+                instantane = registre.instantane()
+                st.write({
+                    serie["composant"]: round(serie["valeur"] / 2**20, 1)
+                    for serie in instantane["jauges"] if serie["nom"] == "decodex_memoire_octets"
+                })
+                st.markdown("**Chemins de similarité**")
+                st.write({
+                    serie["chemin"]: serie["valeur"]
+                    for serie in instantane["compteurs"] if serie["nom"] == "decodex_similarite_requetes_total"
+                })
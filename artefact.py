@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from caracteristiques import poids
+from donnees import charger_catalogue, download_url
+from index_titres import IndexTitres, construire_libelles
+from similarite import MoteurSimilarite
+
+# Version du format sur disque : à incrémenter si la disposition des fichiers change
+FORMAT_ARTEFACT = 1
+
+# Fichier contenant le nom de la version servie, à la racine du dossier d'artefacts
+FICHIER_ACTUEL = "ACTUEL"
+
+# Colonnes conservées pour l'affichage et les filtres (les features sont dans les .npy)
+COLONNES_AFFICHAGE = [
+    "Titre_original", "ID_film", "Affiche", "Lien",
+    "Annee_sortie", "Note_moyenne", "Nb_votants", "Duree_minutes",
+    "Comedie", "Documentaire", "Famille", "Romance",
+]
+
+
+class Artefact:
+    """Catalogue précalculé ouvert depuis le disque.
+
+    Les tableaux (vecteurs normalisés en CSR, table des voisins) sont ouverts avec
+    `np.load(mmap_mode="r")` : plusieurs processus qui ouvrent la même version
+    partagent les mêmes pages du cache du système au lieu d'en garder chacun une copie.
+    """
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        with open(os.path.join(dossier, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest["format"] != FORMAT_ARTEFACT:
+            raise ValueError(f"Format d'artefact non supporté : {self.manifest['format']}")
+        self.version = self.manifest["version"]
+
+        self.metadonnees, self.index_titres = lire_metadonnees(dossier)
+
+        vecteurs = sp.csr_matrix(
+            (self._charger("vecteurs_data"), self._charger("vecteurs_indices"), self._charger("vecteurs_indptr")),
+            shape=tuple(self.manifest["forme_vecteurs"]),
+            copy=False,
+        )
+        voisins = self._charger("voisins") if self.manifest["k_voisins"] else None
+        scores_voisins = self._charger("scores_voisins") if self.manifest["k_voisins"] else None
+        self.moteur = MoteurSimilarite.depuis_vecteurs(
+            vecteurs, voisins, scores_voisins, colonnes=self.manifest["colonnes_features"]
+        )
+
+    def _charger(self, nom):
+        return np.load(os.path.join(self.dossier, f"{nom}.npy"), mmap_mode="r")
+
+
+# Métadonnées (titres, affiches, genres…) et index des titres d'une version, sans les vecteurs
+def lire_metadonnees(dossier):
+    metadonnees = pd.read_parquet(os.path.join(dossier, "metadonnees.parquet"))
+    libelles = pd.read_parquet(os.path.join(dossier, "index_titres.parquet"))["libelle"]
+    return metadonnees, IndexTitres(metadonnees, libelles=libelles.to_numpy(dtype=object))
+
+
+# Dossier de la version à servir : le dossier lui-même s'il contient un manifest,
+# sinon la version désignée par le fichier ACTUEL
+def resoudre_version(dossier):
+    if os.path.exists(os.path.join(dossier, "manifest.json")):
+        return dossier
+    with open(os.path.join(dossier, FICHIER_ACTUEL), encoding="utf-8") as f:
+        return os.path.join(dossier, f.read().strip())
+
+
+# Nom de la version actuellement publiée (lecture d'un petit fichier : peut être appelé à chaque requête)
+def version_actuelle(dossier):
+    return os.path.basename(os.path.normpath(resoudre_version(dossier)))
+
+
+def ouvrir_artefact(dossier):
+    return Artefact(resoudre_version(dossier))
+
+
+# Métadonnées de la version publiée seulement (client d'un service de recommandation distant)
+def ouvrir_metadonnees(dossier):
+    return lire_metadonnees(resoudre_version(dossier))
+
+
+# Bascule atomique de la version servie (écriture dans un fichier temporaire puis os.replace)
+def publier_version(dossier, version):
+    temporaire = os.path.join(dossier, f".{FICHIER_ACTUEL}.tmp")
+    with open(temporaire, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(temporaire, os.path.join(dossier, FICHIER_ACTUEL))
+
+
+def ecrire_artefact(dossier, df, moteur, colonnes_features, source=None, parent=None):
+    """Écrit une nouvelle version de l'artefact dans `dossier` et la publie.
+
+    La version est écrite dans un dossier temporaire puis renommée, de sorte qu'un
+    processus qui ouvre l'artefact ne voit jamais une version incomplète.
+    """
+    version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%fZ")
+    os.makedirs(dossier, exist_ok=True)
+    temporaire = os.path.join(dossier, f".{version}.tmp")
+    os.makedirs(temporaire)
+
+    try:
+        vecteurs = sp.csr_matrix(moteur.vecteurs)
+        vecteurs.sort_indices()
+        np.save(os.path.join(temporaire, "vecteurs_data.npy"), vecteurs.data)
+        np.save(os.path.join(temporaire, "vecteurs_indices.npy"), vecteurs.indices)
+        np.save(os.path.join(temporaire, "vecteurs_indptr.npy"), vecteurs.indptr)
+        k_voisins = 0
+        if moteur.voisins is not None:
+            k_voisins = moteur.voisins.shape[1]
+            np.save(os.path.join(temporaire, "voisins.npy"), np.asarray(moteur.voisins))
+            np.save(os.path.join(temporaire, "scores_voisins.npy"), np.asarray(moteur.scores_voisins))
+
+        colonnes = [col for col in COLONNES_AFFICHAGE if col in df.columns]
+        df[colonnes].reset_index(drop=True).to_parquet(os.path.join(temporaire, "metadonnees.parquet"), index=False)
+        # Libellés uniques (titres désambiguïsés), une ligne par film dans l'ordre des positions
+        pd.DataFrame({"libelle": construire_libelles(df)}).to_parquet(
+            os.path.join(temporaire, "index_titres.parquet"), index=False
+        )
+
+        manifest = {
+            "format": FORMAT_ARTEFACT,
+            "version": version,
+            "source": source,
+            "parent": parent,
+            "nb_films": int(vecteurs.shape[0]),
+            "forme_vecteurs": list(vecteurs.shape),
+            "k_voisins": k_voisins,
+            "colonnes_features": list(colonnes_features),
+            "poids": poids,
+        }
+        with open(os.path.join(temporaire, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        os.rename(temporaire, os.path.join(dossier, version))
+    except BaseException:
+        shutil.rmtree(temporaire, ignore_errors=True)
+        raise
+
+    publier_version(dossier, version)
+    return version
+
+
+def construire_artefact(dossier, source=download_url, k_voisins=50, precision="float64"):
+    df, features, colonnes_features = charger_catalogue(source)
+    # En float32 (ou moins), les vecteurs sont écrits en float32 : moitié moins de disque et de cache
+    moteur = MoteurSimilarite(features, k_voisins=k_voisins, precision=precision, colonnes=colonnes_features)
+    return ecrire_artefact(dossier, df, moteur, colonnes_features, source=source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit l'artefact précalculé du système de recommandation.")
+    parser.add_argument("--sortie", default="artefacts", help="Dossier des artefacts (défaut : artefacts)")
+    parser.add_argument("--source", default=download_url, help="URL ou chemin local du TSV du catalogue")
+    parser.add_argument("--k", type=int, default=50, help="Nombre de voisins précalculés par film (0 : aucun)")
+    parser.add_argument("--precision", default="float64", choices=("float64", "float32"),
+                        help="Précision des vecteurs écrits sur disque")
+    args = parser.parse_args()
+
+    debut = time.perf_counter()
+    version = construire_artefact(args.sortie, source=args.source, k_voisins=args.k, precision=args.precision)
+    print(f"Artefact {version} écrit dans {args.sortie} en {time.perf_counter() - debut:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
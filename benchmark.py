@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from donnees import assembler_catalogue, charger_catalogue
+from genres import GENRES, BitmapsGenres
+from recherche import RechercheTitres
+from recommandation import Recommandeur
+
+# Tailles de catalogue mesurées par défaut
+TAILLES = (10_000, 100_000, 1_000_000)
+
+# Au-delà de cette taille, le TSV n'est pas écrit (plusieurs Go) : le chargement n'est pas mesuré
+# et le catalogue est construit directement en mémoire, morceau par morceau
+TAILLE_MAX_TSV = 100_000
+
+
+# Pic de mémoire résidente du processus depuis son démarrage, en Mo
+def pic_rss_mo():
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pic / 2**20 if sys.platform == "darwin" else pic / 2**10  # octets sous macOS, Ko sous Linux
+
+
+def resume_latences(durees):
+    durees = np.asarray(durees, dtype=np.float64)
+    return {
+        "nb": len(durees),
+        "p50_ms": 1000 * float(np.percentile(durees, 50)),
+        "p99_ms": 1000 * float(np.percentile(durees, 99)),
+        "moyenne_ms": 1000 * float(durees.mean()),
+        "debit_par_s": len(durees) / float(durees.sum()) if durees.sum() > 0 else None,
+    }
+
+
+def mesurer(fonction, *args, **kwargs):
+    debut = time.perf_counter()
+    resultat = fonction(*args, **kwargs)
+    return resultat, time.perf_counter() - debut
+
+
+def morceaux_synthetiques(nb_films, nb_realisateurs=1000, nb_acteurs=4000, acteurs_par_film=4,
+                          taille_morceau=10_000, graine=0):
+    """Génère le catalogue par morceaux de DataFrames : colonnes d'affichage, numériques,
+    genres et une colonne indicatrice par réalisateur (DIR_) et par acteur (ACT_).
+
+    Réalisateurs et acteurs sont tirés selon une loi de Zipf (quelques personnes très
+    présentes, une longue traîne), et environ 5 % des titres sont des doublons.
+    """
+    rng = np.random.default_rng(graine)
+    rangs_dir = 1 / np.arange(1, nb_realisateurs + 1) ** 0.8
+    rangs_act = 1 / np.arange(1, nb_acteurs + 1) ** 0.8
+    colonnes_one_hot = [f"DIR_{j}" for j in range(nb_realisateurs)] + [f"ACT_{j}" for j in range(nb_acteurs)]
+
+    for debut in range(0, nb_films, taille_morceau):
+        nb = min(taille_morceau, nb_films - debut)
+        numeros = np.arange(debut, debut + nb)
+        doublons = rng.random(nb) < 0.05
+        numeros_titres = np.where(doublons, (numeros * rng.random(nb)).astype(np.int64), numeros)
+
+        morceau = pd.DataFrame({
+            "Titre_original": [f"Film {i}" for i in numeros_titres],
+            "ID_film": numeros + 1,
+            "Affiche": [f"/affiche{i}.jpg" for i in numeros],
+            "Note_moyenne": np.round(rng.uniform(1, 10, nb), 1).astype(np.float32),
+            "Nb_votants": rng.zipf(1.5, nb).clip(max=2_000_000).astype(np.float32),
+            "Annee_sortie": rng.integers(1920, 2025, nb).astype(np.float32),
+            "Duree_minutes": rng.integers(5, 240, nb).astype(np.float32),
+            "Film": np.ones(nb, dtype=np.uint8),
+            "Court_metrage": (rng.random(nb) < 0.1).astype(np.uint8),
+            **{genre: (rng.random(nb) < 0.25).astype(np.uint8) for genre in GENRES},
+        })
+
+        one_hot = np.zeros((nb, len(colonnes_one_hot)), dtype=np.uint8)
+        lignes = np.arange(nb)
+        one_hot[lignes, rng.choice(nb_realisateurs, nb, p=rangs_dir / rangs_dir.sum())] = 1
+        for _ in range(acteurs_par_film):
+            one_hot[lignes, nb_realisateurs + rng.choice(nb_acteurs, nb, p=rangs_act / rangs_act.sum())] = 1
+        yield pd.concat([morceau, pd.DataFrame(one_hot, columns=colonnes_one_hot)], axis=1)
+
+
+def ecrire_tsv(chemin, morceaux):
+    """Écrit les morceaux en TSV ; les indicatrices 0/1 sont formatées directement en octets."""
+    with open(chemin, "wb") as f:
+        for numero, morceau in enumerate(morceaux):
+            colonnes_one_hot = [col for col in morceau.columns if col.startswith(("DIR_", "ACT_"))]
+            autres = morceau.drop(columns=colonnes_one_hot)
+            if numero == 0:
+                f.write(("\t".join(list(autres.columns) + colonnes_one_hot) + "\n").encode("utf-8"))
+
+            debuts = autres.to_csv(sep="\t", header=False, index=False, lineterminator="\n").encode("utf-8").splitlines()
+            valeurs = morceau[colonnes_one_hot].to_numpy()
+            caracteres = np.full((len(morceau), 2 * len(colonnes_one_hot)), b"\t", dtype="S1")
+            caracteres[:, 0::2] = np.where(valeurs != 0, b"1", b"0")
+            caracteres[:, -1] = b"\n"
+            fins = caracteres.view(f"S{caracteres.shape[1]}").ravel()
+            f.write(b"".join(debut + b"\t" + fin for debut, fin in zip(debuts, fins)))
+
+
+# Réponse /movie/{id}?append_to_response=credits,videos du faux serveur TMDB
+def reponse_film(film_id):
+    return {
+        "id": film_id, "runtime": 100 + film_id % 60, "overview": f"Synopsis du film {film_id}.",
+        "release_date": "2001-02-03", "vote_average": 6.5, "budget": 1_000_000, "revenue": 3_000_000,
+        "genres": [{"id": 35, "name": "Comédie"}],
+        "credits": {
+            "cast": [{"name": f"Acteur {film_id}-{i}"} for i in range(8)],
+            "crew": [{"name": f"Réalisateur {film_id}", "job": "Director"}],
+        },
+        "videos": {"results": [{"key": f"video{film_id}"}]},
+    }
+
+
+class FauxTMDB(ThreadingHTTPServer):
+    """Serveur local imitant /movie/{id} : chaque réponse attend `latence` s (± `gigue`),
+    et une part `taux_erreur` des requêtes répond 503 pour exercer les relances du client."""
+
+    daemon_threads = True
+
+    def __init__(self, latence=0.05, gigue=0.02, taux_erreur=0.0, graine=0):
+        super().__init__(("127.0.0.1", 0), _GestionnaireFauxTMDB)
+        self.latence = latence
+        self.gigue = gigue
+        self.taux_erreur = taux_erreur
+        self.aleatoire = random.Random(graine)
+        self.nb_requetes = 0
+        self._verrou = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def demarrer(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _GestionnaireFauxTMDB(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Voir service.GestionnaireRequetes
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        serveur = self.server
+        with serveur._verrou:
+            serveur.nb_requetes += 1
+            attente = max(0.0, serveur.latence + serveur.aleatoire.uniform(-serveur.gigue, serveur.gigue))
+            erreur = serveur.aleatoire.random() < serveur.taux_erreur
+        time.sleep(attente)
+
+        morceaux = self.path.split("?")[0].rstrip("/").split("/")
+        if erreur:
+            statut, corps = 503, {"status_message": "Service indisponible"}
+        elif len(morceaux) >= 2 and morceaux[-2] == "movie" and morceaux[-1].isdigit():
+            statut, corps = 200, reponse_film(int(morceaux[-1]))
+        else:
+            statut, corps = 404, {"status_message": "Introuvable"}
+        contenu = json.dumps(corps).encode("utf-8")
+        self.send_response(statut)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(contenu)))
+        self.end_headers()
+        self.wfile.write(contenu)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def mesurer_catalogue(nb_films, dossier, n=10, nb_requetes=1000, taille_lot=256, k_voisins=None,
+                      precision="float64", taille_max_tsv=TAILLE_MAX_TSV, graine=0, **options):
+    """Mesures pour un catalogue de `nb_films` films (à lancer dans un processus neuf pour un pic RSS propre)."""
+    resultat = {"nb_films": nb_films, "etapes": {}}
+    etapes = resultat["etapes"]
+
+    def etape(nom, duree, **details):
+        etapes[nom] = {"duree_s": duree, "pic_rss_mo": pic_rss_mo(), **details}
+
+    morceaux = morceaux_synthetiques(nb_films, graine=graine, **options)
+    if nb_films <= taille_max_tsv:
+        chemin = os.path.join(dossier, f"catalogue_{nb_films}.tsv")
+        _, duree = mesurer(ecrire_tsv, chemin, morceaux)
+        etape("generation", duree, taille_tsv_mo=os.path.getsize(chemin) / 2**20)
+        dossier_cache = os.path.join(dossier, f"cache_{nb_films}")
+        _, duree = mesurer(charger_catalogue, chemin, dossier_cache)
+        etape("chargement_tsv", duree)
+        (df, features, colonnes), duree = mesurer(charger_catalogue, chemin, dossier_cache)
+        etape("chargement_cache", duree)
+    else:
+        (df, features, colonnes), duree = mesurer(assembler_catalogue, morceaux)
+        etape("generation", duree, tsv=False)
+    resultat["nb_colonnes"] = features.shape[1]
+    resultat["nnz"] = int(features.nnz)
+
+    recommandeur, duree = mesurer(
+        Recommandeur.depuis_catalogue, df, k_voisins=k_voisins, features=features, precision=precision,
+        colonnes=colonnes,
+    )
+    etape("construction_moteur", duree, memoire_vecteurs_mo=recommandeur.moteur.memoire_vecteurs() / 2**20)
+    recherche, duree = mesurer(RechercheTitres, recommandeur.index_titres.libelles)
+    etape("construction_recherche", duree)
+    bitmaps, duree = mesurer(BitmapsGenres, recommandeur.df)
+    etape("construction_genres", duree)
+
+    rng = np.random.default_rng(graine)
+    positions = rng.choice(len(recommandeur), min(nb_requetes, len(recommandeur)), replace=False)
+    libelles = [recommandeur.index_titres.libelles[i] for i in positions]
+    masque = bitmaps.masque(bitmaps.union(["Comedie", "Famille"]))
+
+    latences = {
+        "recherche_titres": [], "position_titre": [], "recommandation": [],
+        "recommandation_filtree": [], "recommandation_reclassee": [],
+    }
+    poids_reclassement = {"popularite": 0.3, "note": 0.2, "recence": 0.1, "genres": 0.2}
+    for libelle in libelles:
+        latences["recherche_titres"].append(mesurer(recherche.suggestions, libelle[:6])[1])
+        latences["position_titre"].append(mesurer(recommandeur.index_titres.position, libelle)[1])
+        latences["recommandation"].append(mesurer(recommandeur.recommander, libelle, n)[1])
+        latences["recommandation_filtree"].append(mesurer(recommandeur.recommander, libelle, n, masque=masque)[1])
+        latences["recommandation_reclassee"].append(
+            mesurer(recommandeur.recommander, libelle, n, poids=poids_reclassement, diversite=0.3)[1]
+        )
+    resultat["requetes"] = {nom: resume_latences(durees) for nom, durees in latences.items()}
+
+    durees_lot = [
+        mesurer(recommandeur.voisins_bloc, positions[i:i + taille_lot], n)[1]
+        for i in range(0, len(positions), taille_lot)
+    ]
+    resultat["lot"] = {
+        "taille_lot": taille_lot,
+        "films_par_s": len(positions) / sum(durees_lot),
+        "p50_ms_par_lot": 1000 * float(np.median(durees_lot)),
+    }
+    resultat["pic_rss_mo"] = pic_rss_mo()
+    return resultat
+
+
+def mesurer_tmdb(dossier, latence=0.05, gigue=0.02, taux_erreur=0.0, n=10, nb_pages=30, nb_workers=8):
+    """Enrichissement TMDB d'une page de `n` films contre le faux serveur : séquentiel, parallèle, avec cache."""
+    from cache_tmdb import CacheTMDB
+    from tmdb import ClientTMDB
+
+    serveur = FauxTMDB(latence, gigue, taux_erreur).demarrer()
+    pages = [list(range(p * n + 1, (p + 1) * n + 1)) for p in range(nb_pages)]
+    resultat = {"latence_injectee_ms": 1000 * latence, "taux_erreur": taux_erreur, "films_par_page": n}
+    try:
+        client = ClientTMDB("bench", url_base=serveur.url, nb_workers=nb_workers, facteur_attente=0.01)
+        sequentiel = [mesurer(lambda page: [client.details(i) for i in page], page)[1] for page in pages[:5]]
+        parallele = [mesurer(client.details_lot, page)[1] for page in pages]
+        client.fermer()
+
+        cache = CacheTMDB(os.path.join(dossier, "cache_tmdb.sqlite"))
+        client = ClientTMDB("bench", url_base=serveur.url, nb_workers=nb_workers, facteur_attente=0.01, cache=cache)
+        froid = [mesurer(client.details_lot, page)[1] for page in pages]
+        chaud = [mesurer(client.details_lot, page)[1] for page in pages]
+        client.fermer()
+    finally:
+        serveur.shutdown()
+        serveur.server_close()
+
+    for nom, durees in (("sequentiel", sequentiel), ("parallele", parallele), ("cache_froid", froid), ("cache_chaud", chaud)):
+        resume = resume_latences(durees)
+        resume["films_par_s"] = n * len(durees) / sum(durees)
+        resultat[nom] = resume
+    resultat["taux_succes_cache"] = cache.taux_succes()
+    resultat["requetes_serveur"] = serveur.nb_requetes
+    return resultat
+
+
+def environnement():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "processeurs": os.cpu_count(),
+    }
+
+
+# Comparaison de deux rapports : rapport nouveau / ancien pour chaque mesure commune (> 1 = plus lent)
+def comparer(ancien, nouveau, seuil=1.2, afficher=print):
+    regressions = []
+
+    def parcourir(a, b, chemin):
+        if isinstance(a, dict) and isinstance(b, dict):
+            for cle in a.keys() & b.keys():
+                parcourir(a[cle], b[cle], f"{chemin}.{cle}" if chemin else cle)
+        elif isinstance(a, (int, float)) and isinstance(b, (int, float)) and a > 0:
+            if chemin.endswith(("_s", "_ms", "_mo")) and not chemin.endswith("par_s"):
+                ratio = b / a
+            elif chemin.endswith("par_s"):
+                ratio = a / b if b > 0 else float("inf")
+            else:
+                return
+            if ratio > seuil:
+                regressions.append((chemin, a, b, ratio))
+
+    ancien_catalogues = {str(r["nb_films"]): r for r in ancien.get("catalogues", [])}
+    nouveau_catalogues = {str(r["nb_films"]): r for r in nouveau.get("catalogues", [])}
+    parcourir(ancien_catalogues, nouveau_catalogues, "catalogues")
+    parcourir(ancien.get("tmdb", {}), nouveau.get("tmdb", {}), "tmdb")
+    for chemin, a, b, ratio in sorted(regressions):
+        afficher(f"RÉGRESSION {chemin} : {a:.4g} → {b:.4g} (×{ratio:.2f})")
+    return regressions
+
+
+def afficher_resume(rapport, afficher=print):
+    for catalogue in rapport["catalogues"]:
+        etapes = catalogue["etapes"]
+        afficher(
+            f"{catalogue['nb_films']:>9} films : "
+            + ", ".join(f"{nom} {etape['duree_s']:.2f} s" for nom, etape in etapes.items())
+            + f" | pic RSS {catalogue['pic_rss_mo']:.0f} Mo"
+        )
+        for nom, mesure in catalogue["requetes"].items():
+            afficher(f"{'':>17}{nom:<24} p50 {mesure['p50_ms']:8.3f} ms  p99 {mesure['p99_ms']:8.3f} ms")
+        afficher(f"{'':>17}{'lot':<24} {catalogue['lot']['films_par_s']:.0f} films/s")
+    if "tmdb" in rapport:
+        tmdb = rapport["tmdb"]
+        for nom in ("sequentiel", "parallele", "cache_froid", "cache_chaud"):
+            afficher(
+                f"TMDB {nom:<12} page de {tmdb['films_par_page']} : p50 {tmdb[nom]['p50_ms']:.1f} ms, "
+                f"p99 {tmdb[nom]['p99_ms']:.1f} ms, {tmdb[nom]['films_par_s']:.0f} films/s"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure chargement, similarité, recherche et enrichissement TMDB sur des catalogues synthétiques.")
+    parser.add_argument("--tailles", type=int, nargs="+", default=list(TAILLES), help="Nombres de films des catalogues")
+    parser.add_argument("--realisateurs", type=int, default=1000, help="Nombre de colonnes DIR_")
+    parser.add_argument("--acteurs", type=int, default=4000, help="Nombre de colonnes ACT_")
+    parser.add_argument("--taille-max-tsv", type=int, default=TAILLE_MAX_TSV, help="Taille maximale écrite en TSV")
+    parser.add_argument("-n", type=int, default=10, help="Nombre de films similaires par requête")
+    parser.add_argument("--requetes", type=int, default=1000, help="Nombre de requêtes mesurées par catalogue")
+    parser.add_argument("--k", type=int, default=0, help="Voisins précalculés (0 : calcul exact à la demande)")
+    parser.add_argument("--precision", default="float64", help="Précision des vecteurs (voir stockage.py)")
+    parser.add_argument("--latence-tmdb", type=float, default=0.05, help="Latence injectée du faux TMDB, en s")
+    parser.add_argument("--erreurs-tmdb", type=float, default=0.0, help="Part des requêtes TMDB en erreur 503")
+    parser.add_argument("--sans-tmdb", action="store_true", help="Ne pas mesurer l'enrichissement TMDB")
+    parser.add_argument("--sortie", default="benchmark.json", help="Fichier JSON des résultats")
+    parser.add_argument("--comparer", help="Rapport JSON précédent auquel comparer les résultats")
+    args = parser.parse_args()
+
+    rapport = {"environnement": environnement(), "parametres": vars(args), "catalogues": []}
+    with tempfile.TemporaryDirectory(prefix="decodex-bench-") as dossier:
+        # Un processus neuf par taille : le pic RSS mesuré ne dépend pas des tailles précédentes
+        for nb_films in args.tailles:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executeur:
+                catalogue = executeur.submit(
+                    mesurer_catalogue, nb_films, dossier, n=args.n, nb_requetes=args.requetes,
+                    k_voisins=args.k or None, precision=args.precision, taille_max_tsv=args.taille_max_tsv,
+                    nb_realisateurs=args.realisateurs, nb_acteurs=args.acteurs,
+                ).result()
+            rapport["catalogues"].append(catalogue)
+            print(f"{nb_films} films mesurés", file=sys.stderr)
+        if not args.sans_tmdb:
+            rapport["tmdb"] = mesurer_tmdb(dossier, latence=args.latence_tmdb, taux_erreur=args.erreurs_tmdb, n=args.n)
+
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump(rapport, f, indent=2, ensure_ascii=False)
+    afficher_resume(rapport)
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            comparer(json.load(f), rapport)
+
+
+if __name__ == "__main__":
+    main()
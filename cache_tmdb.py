@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Chemin par défaut du cache disque partagé par tous les processus
+CHEMIN_CACHE_TMDB = os.getenv("TMDB_CACHE", "cache_tmdb.sqlite")
+
+# États possibles d'une entrée lue dans le cache
+FRAIS, PERIME, ABSENT = "frais", "perime", "absent"
+
+
+class EntreeCache:
+    """Réponse TMDB mise en cache : `donnees` vaut None pour une entrée négative (404, identifiant manquant)."""
+
+    __slots__ = ("donnees", "statut", "ecrit_le", "expire_le")
+
+    def __init__(self, donnees, statut, ecrit_le, expire_le):
+        self.donnees = donnees
+        self.statut = statut
+        self.ecrit_le = ecrit_le
+        self.expire_le = expire_le
+
+    @property
+    def negative(self):
+        return self.donnees is None
+
+
+class CacheTMDB:
+    """Cache à deux niveaux des réponses TMDB, indexé par (film_id, langue).
+
+    Niveau 1 : LRU borné en mémoire, propre au processus.
+    Niveau 2 : base SQLite sur disque (mode WAL) partagée par tous les processus.
+    Une entrée est fraîche jusqu'à son expiration (`ttl`, ou `ttl_negatif` pour les
+    404), puis périmée pendant `delai_perime` : elle est encore servie pendant que
+    l'appelant la rafraîchit en arrière-plan (stale-while-revalidate).
+    """
+
+    def __init__(self, chemin=CHEMIN_CACHE_TMDB, taille_memoire=2048, ttl=7 * 24 * 3600,
+                 ttl_negatif=24 * 3600, delai_perime=30 * 24 * 3600):
+        self.chemin = chemin
+        self.taille_memoire = taille_memoire
+        self.ttl = ttl
+        self.ttl_negatif = ttl_negatif
+        self.delai_perime = delai_perime
+
+        self._memoire = OrderedDict()
+        self._verrou = threading.Lock()
+        self._local = threading.local()
+        self.compteurs = {"hits_memoire": 0, "hits_disque": 0, "misses": 0, "perimes": 0, "negatifs": 0, "ecritures": 0}
+
+        with self._connexion() as connexion:
+            connexion.execute(
+                "CREATE TABLE IF NOT EXISTS films ("
+                " film_id TEXT NOT NULL, langue TEXT NOT NULL, statut INTEGER NOT NULL,"
+                " donnees TEXT, ecrit_le REAL NOT NULL, expire_le REAL NOT NULL,"
+                " PRIMARY KEY (film_id, langue))"
+            )
+
+    # Une connexion SQLite par thread (les connexions ne se partagent pas entre threads)
+    def _connexion(self):
+        connexion = getattr(self._local, "connexion", None)
+        if connexion is None:
+            connexion = sqlite3.connect(self.chemin, timeout=30)
+            connexion.execute("PRAGMA journal_mode=WAL")
+            connexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.connexion = connexion
+        return connexion
+
+    def _compter(self, compteur):
+        with self._verrou:
+            self.compteurs[compteur] += 1
+
+    def _memoriser(self, cle, entree):
+        with self._verrou:
+            self._memoire[cle] = entree
+            self._memoire.move_to_end(cle)
+            while len(self._memoire) > self.taille_memoire:
+                self._memoire.popitem(last=False)
+
+    def _etat(self, entree, maintenant):
+        if entree.expire_le > maintenant:
+            return FRAIS
+        if entree.expire_le + self.delai_perime > maintenant:
+            return PERIME
+        return ABSENT
+
+    def lire(self, film_id, langue):
+        """Retourne (entrée, état) ; l'entrée vaut None si l'état est ABSENT."""
+        cle = (str(film_id), langue)
+        maintenant = time.time()
+
+        with self._verrou:
+            entree = self._memoire.get(cle)
+            if entree is not None:
+                self._memoire.move_to_end(cle)
+        compteur = "hits_memoire"
+
+        if entree is None:
+            ligne = self._connexion().execute(
+                "SELECT donnees, statut, ecrit_le, expire_le FROM films WHERE film_id = ? AND langue = ?", cle
+            ).fetchone()
+            if ligne is not None:
+                donnees = json.loads(ligne[0]) if ligne[0] is not None else None
+                entree = EntreeCache(donnees, ligne[1], ligne[2], ligne[3])
+                self._memoriser(cle, entree)
+                compteur = "hits_disque"
+
+        etat = self._etat(entree, maintenant) if entree is not None else ABSENT
+        if etat == ABSENT:
+            self._compter("misses")
+            return None, ABSENT
+        self._compter(compteur)
+        if etat == PERIME:
+            self._compter("perimes")
+        if entree.negative:
+            self._compter("negatifs")
+        return entree, etat
+
+    def ecrire(self, film_id, langue, donnees, statut=200):
+        """Enregistre une réponse (ou une entrée négative si `donnees` est None) dans les deux niveaux."""
+        cle = (str(film_id), langue)
+        maintenant = time.time()
+        ttl = self.ttl if donnees is not None else self.ttl_negatif
+        entree = EntreeCache(donnees, statut, maintenant, maintenant + ttl)
+        connexion = self._connexion()
+        with connexion:
+            connexion.execute(
+                "INSERT OR REPLACE INTO films (film_id, langue, statut, donnees, ecrit_le, expire_le)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (*cle, statut, json.dumps(donnees) if donnees is not None else None, entree.ecrit_le, entree.expire_le),
+            )
+        self._memoriser(cle, entree)
+        self._compter("ecritures")
+        return entree
+
+    # Taux de succès du cache (mémoire + disque) depuis le démarrage du processus
+    def taux_succes(self):
+        hits = self.compteurs["hits_memoire"] + self.compteurs["hits_disque"]
+        total = hits + self.compteurs["misses"]
+        return hits / total if total else 0.0
+
+
+# Préchargement du cache pour tout le catalogue (colonne ID_film de df)
+def prechauffer(client, film_ids, taille_lot=200, afficher=print):
+    film_ids = list(dict.fromkeys(film_ids))  # Dédoublonnage en conservant l'ordre
+    a_charger = [
+        film_id for film_id in film_ids
+        if client.cache.lire(film_id, client.langue)[1] != FRAIS
+    ]
+    debut = time.perf_counter()
+    for i in range(0, len(a_charger), taille_lot):
+        client.details_lot(a_charger[i:i + taille_lot])
+        fait = min(i + taille_lot, len(a_charger))
+        afficher(f"{fait}/{len(a_charger)} films chargés ({fait / (time.perf_counter() - debut):.0f} films/s)")
+    return len(a_charger)
+
+
+def main():
+    from artefact import ouvrir_artefact
+    from donnees import charger_catalogue, download_url
+    from tmdb import ClientTMDB
+
+    parser = argparse.ArgumentParser(description="Précharge le cache TMDB pour tout le catalogue.")
+    parser.add_argument("--cache", default=CHEMIN_CACHE_TMDB, help="Chemin de la base SQLite du cache")
+    parser.add_argument("--source", default=download_url, help="URL ou chemin local du TSV du catalogue")
+    parser.add_argument("--artefact", help="Dossier d'artefact à utiliser à la place du TSV")
+    parser.add_argument("--workers", type=int, default=16, help="Nombre de requêtes TMDB simultanées")
+    args = parser.parse_args()
+
+    df = ouvrir_artefact(args.artefact).metadonnees if args.artefact else charger_catalogue(args.source)[0]
+    client = ClientTMDB(os.getenv("TMDB_API_KEY"), nb_workers=args.workers, cache=CacheTMDB(args.cache))
+    nb = prechauffer(client, df["ID_film"].tolist())
+    print(f"{nb} films préchargés, compteurs : {client.cache.compteurs}")
+    client.fermer()
+
+
+if __name__ == "__main__":
+    main()
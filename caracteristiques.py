@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# Pondération des colonnes
+poids = {
+    "Note_moyenne": 5, "Nb_votants": 5, "Annee_sortie": 5, "Duree_minutes": 5,
+    "Film": 5, "Court_metrage": 5,
+    "Comedie": 10, "Documentaire": 10, "Famille": 10, "Romance": 10,
+    "DIR_": 20, "ACT_": 25  # Poids pour les colonnes des directeurs et acteurs
+}
+
+PREFIXES_ONE_HOT = ("DIR_", "ACT_")
+
+
+# Poids d'une colonne : poids propre, sinon poids du préfixe DIR_/ACT_, sinon 1
+def poids_colonne(col, poids=poids):
+    if col in poids:  # Pondération des colonnes générales
+        return poids[col]
+    for prefixe in PREFIXES_ONE_HOT:
+        if col.startswith(prefixe):  # Pondération des colonnes des directeurs et acteurs
+            return poids[prefixe]
+    return 1
+
+
+# Colonnes numériques retenues pour la similarité (équivalent de select_dtypes(include=[np.number]))
+def colonnes_numeriques(df):
+    return [
+        col for col, dtype in df.dtypes.items()
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+    ]
+
+
+# Conversion d'un bloc de colonnes one-hot en CSR sans densifier la matrice complète
+def _one_hot_en_csr(df, colonnes):
+    lignes, indices_colonnes, valeurs = [], [], []
+    for j, col in enumerate(colonnes):
+        colonne = df[col].to_numpy()
+        non_nuls = np.flatnonzero(colonne)
+        lignes.append(non_nuls)
+        indices_colonnes.append(np.full(len(non_nuls), j, dtype=np.int32))
+        valeurs.append(colonne[non_nuls].astype(np.float64))
+    if not colonnes:
+        return sp.csr_matrix((len(df), 0))
+    return sp.csr_matrix(
+        (np.concatenate(valeurs), (np.concatenate(lignes), np.concatenate(indices_colonnes))),
+        shape=(len(df), len(colonnes)),
+    )
+
+
+def construire_features(df, poids=poids):
+    """Construit la matrice CSR pondérée des colonnes numériques de `df`.
+
+    Les colonnes DIR_/ACT_ (une par réalisateur ou acteur, presque toujours nulles)
+    sont lues directement en creux ; les pondérations sont appliquées par une mise
+    à l'échelle diagonale, sans modifier ni copier `df` colonne par colonne.
+    Retourne la matrice et la liste des colonnes dans l'ordre de la matrice.
+    """
+    colonnes = colonnes_numeriques(df)
+    colonnes_denses = [col for col in colonnes if not col.startswith(PREFIXES_ONE_HOT)]
+    colonnes_creuses = [col for col in colonnes if col.startswith(PREFIXES_ONE_HOT)]
+
+    matrice = sp.hstack(
+        [
+            sp.csr_matrix(df[colonnes_denses].to_numpy(dtype=np.float64)),
+            _one_hot_en_csr(df, colonnes_creuses),
+        ],
+        format="csr",
+    )
+    ordre = colonnes_denses + colonnes_creuses
+    echelle = sp.diags(np.array([poids_colonne(col, poids) for col in ordre], dtype=np.float64))
+    return (matrice @ echelle).tocsr(), ordre
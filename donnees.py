@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+import requests
+import scipy.sparse as sp
+
+from caracteristiques import PREFIXES_ONE_HOT, construire_features, poids
+
+# Lien partie 1
+url = "https://drive.google.com/file/d/1d667eGYQCc_LGMiX3OJhhMiuFyiKCzih/view?usp=drive_link"
+
+# Regex pour récupérer le lien URL
+pattern = r"https://drive.google.com/file/d/([a-zA-Z0-9_-]+)/view\?usp=drive_link"
+
+# Utilisation de re.search pour trouver l'ID du fichier
+match = re.search(pattern, url)
+
+file_id = match.group(1)
+# Créer l'URL de téléchargement direct avec l'ID extrait
+download_url = f"https://drive.google.com/uc?id={file_id}"
+
+# URL de base pour les affiches
+url_image_base = "https://image.tmdb.org/t/p/w600_and_h900_bestv2"
+
+# Dossier du cache local (copie du TSV et version colonnaire du catalogue)
+DOSSIER_CACHE_DONNEES = os.getenv("DECODEX_CACHE_DONNEES", "cache_donnees")
+
+# Délai pendant lequel la copie locale du TSV distant est utilisée sans même interroger la source
+DUREE_VALIDITE_SOURCE = int(os.getenv("DECODEX_VALIDITE_SOURCE", "3600"))
+
+# Version du format du cache colonnaire : à incrémenter quand son contenu change de forme
+FORMAT_CACHE_CATALOGUE = 2
+
+# Types compacts des colonnes connues du catalogue
+COLONNES_INDICATRICES = ("Film", "Court_metrage", "Comedie", "Documentaire", "Famille", "Romance")
+COLONNES_NUMERIQUES = ("Note_moyenne", "Nb_votants", "Annee_sortie", "Duree_minutes")
+COLONNES_TEXTE = ("Titre_original", "Affiche")
+
+# Colonnes utiles à la recherche de titres et au filtre des genres seuls (client du service)
+COLONNES_METADONNEES = ("Titre_original", "ID_film", "Affiche", "Annee_sortie", "Comedie", "Documentaire", "Famille", "Romance")
+
+
+# Types de lecture : uint8 pour les indicatrices 0/1 (genres, DIR_/ACT_), float32 pour les
+# valeurs numériques, texte lu tel quel puis converti en catégories une fois le fichier lu
+def types_colonnes(colonnes):
+    types = {}
+    for col in colonnes:
+        if col.startswith(PREFIXES_ONE_HOT) or col in COLONNES_INDICATRICES:
+            types[col] = "uint8"
+        elif col in COLONNES_NUMERIQUES:
+            types[col] = "float32"
+        elif col in COLONNES_TEXTE:
+            types[col] = "object"
+    return types
+
+
+def est_url(source):
+    return str(source).startswith(("http://", "https://"))
+
+
+# Sommes déjà calculées, par (chemin, taille, date de modification) : un fichier inchangé n'est pas relu
+_sommes_controle = {}
+
+
+def somme_controle(chemin, taille_bloc=2**20):
+    infos = os.stat(chemin)
+    cle = (os.path.realpath(chemin), infos.st_size, infos.st_mtime_ns)
+    if cle not in _sommes_controle:
+        empreinte = hashlib.sha256()
+        with open(chemin, "rb") as f:
+            for bloc in iter(lambda: f.read(taille_bloc), b""):
+                empreinte.update(bloc)
+        _sommes_controle[cle] = empreinte.hexdigest()
+    return _sommes_controle[cle]
+
+
+# Clé du cache colonnaire : somme de contrôle du TSV, poids des features et version du format
+def cle_catalogue(chemin, poids=poids):
+    empreinte = hashlib.sha256()
+    empreinte.update(somme_controle(chemin).encode())
+    empreinte.update(json.dumps(poids, sort_keys=True).encode())
+    empreinte.update(str(FORMAT_CACHE_CATALOGUE).encode())
+    return empreinte.hexdigest()[:16]
+
+
+# Chemin temporaire propre au processus, à côté de `chemin` : plusieurs processus qui écrivent le même
+# fichier en même temps ne se mélangent pas, et le renommage final (os.replace) reste atomique
+def _temporaire(chemin):
+    descripteur, temporaire = tempfile.mkstemp(
+        dir=os.path.dirname(chemin) or ".", prefix=f".{os.path.basename(chemin)}.", suffix=".tmp"
+    )
+    os.close(descripteur)
+    return temporaire
+
+
+def _remplacer(chemin, ecrire):
+    temporaire = _temporaire(chemin)
+    try:
+        ecrire(temporaire)
+        os.replace(temporaire, chemin)
+    except BaseException:
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+        raise
+
+
+def telecharger_source(source, dossier_cache=DOSSIER_CACHE_DONNEES):
+    """Copie locale du TSV distant, retéléchargée uniquement si la source a changé.
+
+    La copie est réutilisée telle quelle pendant DUREE_VALIDITE_SOURCE ; ensuite la
+    source est interrogée avec If-None-Match / If-Modified-Since et n'est
+    retransférée que si le serveur ne répond pas 304.
+    """
+    os.makedirs(dossier_cache, exist_ok=True)
+    chemin = os.path.join(dossier_cache, "source.tsv")
+    chemin_infos = os.path.join(dossier_cache, "source.json")
+    infos = {}
+    if os.path.exists(chemin) and os.path.exists(chemin_infos):
+        with open(chemin_infos, encoding="utf-8") as f:
+            infos = json.load(f)
+        if infos.get("url") != source:
+            infos = {}
+        elif time.time() - infos.get("verifie_le", 0) < DUREE_VALIDITE_SOURCE:
+            return chemin
+
+    entetes = {}
+    if infos.get("etag"):
+        entetes["If-None-Match"] = infos["etag"]
+    if infos.get("last_modified"):
+        entetes["If-Modified-Since"] = infos["last_modified"]
+
+    with requests.get(source, headers=entetes, stream=True, timeout=(10, 300)) as response:
+        if response.status_code == 304:
+            infos["verifie_le"] = time.time()
+        else:
+            response.raise_for_status()
+
+            def ecrire_source(temporaire):
+                with open(temporaire, "wb") as f:
+                    for bloc in response.iter_content(chunk_size=2**20):
+                        f.write(bloc)
+
+            _remplacer(chemin, ecrire_source)
+            infos = {
+                "url": source,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "verifie_le": time.time(),
+            }
+
+    def ecrire_infos(temporaire):
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(infos, f)
+
+    _remplacer(chemin_infos, ecrire_infos)
+    return chemin
+
+
+# Finalisation commune : colonne "Lien" puis texte converti en catégories
+def _finaliser(df):
+    # Créer la colonne "Lien" en concaténant l'URL de base et la colonne "Affiche"
+    df["Lien"] = url_image_base + df["Affiche"].astype(str)
+    for col in COLONNES_TEXTE:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def assembler_catalogue(morceaux):
+    """(df, features, colonnes_features) à partir de morceaux de DataFrame du catalogue.
+
+    Les colonnes DIR_/ACT_ ne sont conservées que dans la matrice creuse : le DataFrame
+    retourné ne garde que les colonnes d'affichage, de filtre et les valeurs numériques.
+    """
+    parties, matrices = [], []
+    colonnes_features = None
+    for morceau in morceaux:
+        matrice, colonnes_features = construire_features(morceau, poids)
+        matrices.append(matrice)
+        parties.append(morceau[[col for col in morceau.columns if not col.startswith(PREFIXES_ONE_HOT)]])
+
+    df = _finaliser(pd.concat(parties, ignore_index=True))
+    return df, sp.vstack(matrices, format="csr"), colonnes_features
+
+
+def lire_catalogue(chemin, taille_morceau=10_000):
+    """Lit le TSV par morceaux avec des types compacts et construit la matrice de features au fil de l'eau."""
+    colonnes = pd.read_csv(chemin, delimiter="\t", nrows=0).columns
+    return assembler_catalogue(
+        pd.read_csv(chemin, delimiter="\t", dtype=types_colonnes(colonnes), chunksize=taille_morceau)
+    )
+
+
+def charger_catalogue(source=download_url, dossier_cache=DOSSIER_CACHE_DONNEES, taille_morceau=10_000):
+    """Catalogue (df, features, colonnes_features) depuis une URL ou un fichier TSV local.
+
+    Le résultat est mis en cache sous forme colonnaire (Parquet pour le DataFrame,
+    .npz pour la matrice creuse) dans un dossier nommé d'après `cle_catalogue` : tant que
+    la source, les poids des features et le format ne changent pas, le TSV n'est ni
+    retéléchargé ni reparsé.
+    """
+    chemin = telecharger_source(source, dossier_cache) if est_url(source) else source
+    cle = cle_catalogue(chemin)
+    dossier = os.path.join(dossier_cache, f"catalogue-{cle}")
+
+    if os.path.exists(os.path.join(dossier, "colonnes.json")):
+        df = pd.read_parquet(os.path.join(dossier, "catalogue.parquet"))
+        features = sp.load_npz(os.path.join(dossier, "features.npz")).tocsr()
+        with open(os.path.join(dossier, "colonnes.json"), encoding="utf-8") as f:
+            colonnes_features = json.load(f)
+        return df, features, colonnes_features
+
+    df, features, colonnes_features = lire_catalogue(chemin, taille_morceau)
+
+    # Écriture dans un dossier temporaire propre au processus, puis renommage : un autre processus
+    # ne voit jamais de cache incomplet, et si deux processus le construisent en même temps,
+    # le premier renommage l'emporte et l'autre copie est abandonnée
+    os.makedirs(dossier_cache, exist_ok=True)
+    temporaire = tempfile.mkdtemp(dir=dossier_cache, prefix=f".catalogue-{cle}.", suffix=".tmp")
+    try:
+        df.to_parquet(os.path.join(temporaire, "catalogue.parquet"), index=False)
+        sp.save_npz(os.path.join(temporaire, "features.npz"), features)
+        with open(os.path.join(temporaire, "colonnes.json"), "w", encoding="utf-8") as f:
+            json.dump(colonnes_features, f)
+        os.rename(temporaire, dossier)
+    except OSError:
+        # Dossier déjà publié par un autre processus : cette copie est simplement abandonnée
+        if not os.path.exists(os.path.join(dossier, "colonnes.json")):
+            raise
+    finally:
+        shutil.rmtree(temporaire, ignore_errors=True)
+    return df, features, colonnes_features
+
+
+def charger_metadonnees(source=download_url, dossier_cache=DOSSIER_CACHE_DONNEES):
+    """Titres, affiches et genres du catalogue, sans features ni colonnes DIR_/ACT_.
+
+    Seules les COLONNES_METADONNEES sont converties : suffisant pour la recherche de
+    titres et le filtre des genres quand les recommandations viennent d'un service.
+    """
+    chemin = telecharger_source(source, dossier_cache) if est_url(source) else source
+    colonnes = pd.read_csv(chemin, delimiter="\t", nrows=0).columns
+    colonnes = [col for col in colonnes if col in COLONNES_METADONNEES]
+    return _finaliser(pd.read_csv(chemin, delimiter="\t", usecols=colonnes, dtype=types_colonnes(colonnes)))
+
+
+# Charger le fichier CSV complet (toutes les colonnes) depuis l'URL de téléchargement direct ou un fichier local
+def charger_donnees(source=download_url):
+    chemin = telecharger_source(source) if est_url(source) else source
+    colonnes = pd.read_csv(chemin, delimiter="\t", nrows=0).columns
+    return _finaliser(pd.read_csv(chemin, delimiter="\t", dtype=types_colonnes(colonnes)))
@@ -0,0 +1,46 @@
+import numpy as np
+
+# Colonnes de genre du catalogue et libellés affichés
+GENRES = {
+    "Comedie": "Comédie",
+    "Documentaire": "Documentaire",
+    "Famille": "Famille",
+    "Romance": "Romance",
+}
+
+# Nombre de bits à 1 pour chaque valeur d'octet (comptage sans dépaqueter)
+_BITS_PAR_OCTET = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+class BitmapsGenres:
+    """Appartenance des films aux genres, stockée en bitsets compacts (1 bit par film et par genre).
+
+    Les bitsets sont calculés une seule fois au chargement ; toute combinaison de
+    genres se réduit à quelques OU / ET binaires sur N/8 octets.
+    """
+
+    def __init__(self, df, genres=GENRES):
+        self.nb_films = len(df)
+        self.bitsets = {
+            genre: np.packbits(df[genre].to_numpy() != 0)
+            for genre in genres if genre in df.columns
+        }
+        self._vide = np.zeros((self.nb_films + 7) // 8, dtype=np.uint8)
+
+    def __contains__(self, genre):
+        return genre in self.bitsets
+
+    # Films appartenant à au moins un des genres (bitset)
+    def union(self, genres):
+        resultat = self._vide.copy()
+        for genre in genres:
+            np.bitwise_or(resultat, self.bitsets[genre], out=resultat)
+        return resultat
+
+    # Conversion d'un bitset en masque booléen aligné sur les lignes du catalogue
+    def masque(self, bitset):
+        return np.unpackbits(bitset, count=self.nb_films).astype(bool)
+
+    @staticmethod
+    def compter(bitset):
+        return int(_BITS_PAR_OCTET[bitset].sum())
@@ -0,0 +1,131 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from similarite import produits_scalaires, selectionner_top_n
+
+
+# Scores cosinus de vecteurs (creux ou denses) contre des centroïdes déjà transposés (D × nb_listes,
+# C-contigus) : `creux @ centroides.T` ferait copier par SciPy toute la transposée à chaque appel
+def _scores_centroides(vecteurs, centroides_t):
+    return np.asarray(vecteurs @ centroides_t)
+
+
+# Affectation de chaque vecteur au centroïde le plus proche (cosinus), par blocs
+def _affecter(vecteurs, centroides, taille_bloc=4096):
+    centroides_t = np.ascontiguousarray(centroides.T)
+    affectations = np.empty(vecteurs.shape[0], dtype=np.int32)
+    for debut in range(0, vecteurs.shape[0], taille_bloc):
+        bloc = vecteurs[debut:debut + taille_bloc]
+        affectations[debut:debut + taille_bloc] = np.argmax(_scores_centroides(bloc, centroides_t), axis=1)
+    return affectations
+
+
+def _dense(matrice):
+    return matrice.toarray() if sp.issparse(matrice) else np.array(matrice)
+
+
+# K-means sphérique : les centroïdes sont renormalisés à chaque itération
+def _kmeans_spherique(vecteurs, nb_listes, nb_iterations, rng):
+    nb_films = vecteurs.shape[0]
+    centroides = _dense(vecteurs[rng.choice(nb_films, nb_listes, replace=False)])
+    for _ in range(nb_iterations):
+        affectations = _affecter(vecteurs, centroides)
+        # Somme des vecteurs de chaque liste via une matrice d'appartenance creuse
+        appartenance = sp.csr_matrix(
+            (np.ones(nb_films), (affectations, np.arange(nb_films))), shape=(nb_listes, nb_films)
+        )
+        sommes = _dense(appartenance @ vecteurs)
+        comptes = np.bincount(affectations, minlength=nb_listes)
+        # Les listes vides sont réinitialisées sur un film tiré au hasard
+        vides = np.flatnonzero(comptes == 0)
+        if len(vides):
+            sommes[vides] = _dense(vecteurs[rng.choice(nb_films, len(vides), replace=False)])
+        normes = np.linalg.norm(sommes, axis=1, keepdims=True)
+        normes[normes == 0] = 1.0
+        centroides = sommes / normes
+    return centroides
+
+
+class IndexIVF:
+    """Index approché à listes inversées (IVF) construit par k-means sphérique.
+
+    Construction : les films sont répartis en `nb_listes` groupes autour de centroïdes.
+    Requête : seuls les films des `nb_sondes` groupes les plus proches sont scorés.
+    `nb_sondes` est le réglage rappel/latence : plus il est grand, plus le résultat
+    se rapproche du classement exact, et plus la requête coûte.
+    """
+
+    def __init__(self, vecteurs, nb_listes=None, nb_sondes=8, nb_iterations=10,
+                 taille_echantillon=50_000, graine=0):
+        self.vecteurs = vecteurs
+        nb_films = vecteurs.shape[0]
+        self.nb_listes = min(nb_listes or max(1, int(np.sqrt(nb_films))), nb_films)
+        self.nb_sondes = nb_sondes
+
+        # Entraînement sur un échantillon, puis affectation de tout le catalogue
+        rng = np.random.default_rng(graine)
+        if nb_films > taille_echantillon:
+            echantillon = vecteurs[np.sort(rng.choice(nb_films, taille_echantillon, replace=False))]
+        else:
+            echantillon = vecteurs
+        centroides = _kmeans_spherique(echantillon, self.nb_listes, nb_iterations, rng)
+        self.affectations = _affecter(vecteurs, centroides)
+        # Centroïdes conservés transposés (D × nb_listes) : une requête les lit sans copie
+        self.centroides_t = np.ascontiguousarray(centroides.T)
+
+        # Listes inversées stockées à plat : films triés par liste + offsets de début
+        self.membres = np.argsort(self.affectations, kind="stable").astype(np.int32)
+        self.debuts = np.concatenate(
+            ([0], np.cumsum(np.bincount(self.affectations, minlength=self.nb_listes)))
+        )
+
+    def __len__(self):
+        return self.vecteurs.shape[0]
+
+    # Mémoire propre à l'index (les vecteurs sont ceux du moteur)
+    @property
+    def nbytes(self):
+        return self.centroides_t.nbytes + self.affectations.nbytes + self.membres.nbytes + self.debuts.nbytes
+
+    # Films appartenant aux listes les plus proches du vecteur requête (matrice 1×D)
+    def candidats(self, requete, nb_sondes=None):
+        nb_sondes = min(nb_sondes or self.nb_sondes, self.nb_listes)
+        proches = selectionner_top_n(_scores_centroides(requete, self.centroides_t)[0], nb_sondes)
+        return np.concatenate([self.membres[self.debuts[l]:self.debuts[l + 1]] for l in proches])
+
+    # Indices des n films approximativement les plus similaires (le film lui-même est exclu)
+    def top_n(self, index, n, nb_sondes=None, masque=None):
+        requete = self.vecteurs[[index]]
+        candidats = self.candidats(requete, nb_sondes)
+        candidats = candidats[candidats != index]
+        if masque is not None:
+            candidats = candidats[masque[candidats]]
+        scores = produits_scalaires(requete, self.vecteurs[candidats])[0]
+        return candidats[selectionner_top_n(scores, n)]
+
+
+# Rappel@n de l'index approché par rapport au classement exact du moteur
+def evaluer_rappel(moteur, index, n=10, taille_echantillon=200, nb_sondes=None, graine=0):
+    """Mesure le rappel@n moyen et les latences (ms) exacte et approchée sur un échantillon de films."""
+    rng = np.random.default_rng(graine)
+    requetes = rng.choice(len(moteur), min(taille_echantillon, len(moteur)), replace=False)
+    rappels, latences_exactes, latences_approchees = [], [], []
+    for i in requetes:
+        debut = time.perf_counter()
+        exact = selectionner_top_n(moteur.scores(i), n, exclure=i)
+        latences_exactes.append(time.perf_counter() - debut)
+
+        debut = time.perf_counter()
+        approche = index.top_n(i, n, nb_sondes=nb_sondes)
+        latences_approchees.append(time.perf_counter() - debut)
+
+        rappels.append(len(np.intersect1d(exact, approche)) / max(len(exact), 1))
+    return {
+        "n": n,
+        "nb_sondes": nb_sondes or index.nb_sondes,
+        "rappel": float(np.mean(rappels)),
+        "latence_exacte_ms": 1000 * float(np.median(latences_exactes)),
+        "latence_approchee_ms": 1000 * float(np.median(latences_approchees)),
+    }
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+
+# Libellés uniques : un titre partagé par plusieurs films est suivi de son année,
+# puis de son identifiant TMDB si l'année ne suffit pas à les distinguer
+def construire_libelles(df):
+    titres = df["Titre_original"].astype(str).reset_index(drop=True)
+    libelles = titres.copy()
+    doublons = titres.duplicated(keep=False)
+    if not doublons.any():
+        return libelles.to_numpy(dtype=object)
+
+    if "Annee_sortie" in df.columns:
+        annees = pd.to_numeric(df["Annee_sortie"], errors="coerce").reset_index(drop=True)
+        annees = annees.map(lambda a: "" if pd.isna(a) else str(int(a)))
+    else:
+        annees = pd.Series("", index=titres.index)
+    identifiants = df["ID_film"].astype(str).reset_index(drop=True)
+
+    precisions = annees.where(annees != "", identifiants)
+    libelles[doublons] = titres[doublons] + " (" + precisions[doublons] + ")"
+    encore = libelles.duplicated(keep=False)
+    precisions = (annees + ", " + identifiants).where(annees != "", identifiants)
+    libelles[encore] = titres[encore] + " (" + precisions[encore] + ")"
+    return libelles.to_numpy(dtype=object)
+
+
+class IndexTitres:
+    """Index des titres du catalogue construit une fois au chargement.
+
+    `position` résout un libellé (ou un titre) en numéro de ligne par simple
+    accès dictionnaire ; `resultats` rassemble titres, affiches et identifiants
+    de plusieurs lignes avec `np.take` sur des colonnes compactes, sans `df.iloc`.
+    """
+
+    def __init__(self, df, libelles=None):
+        self.titres = df["Titre_original"].to_numpy(dtype=object)
+        self.liens = df["Lien"].to_numpy(dtype=object)
+        self.ids = df["ID_film"].to_numpy()
+        self.libelles = np.asarray(libelles, dtype=object) if libelles is not None else construire_libelles(df)
+
+        self._par_libelle = {libelle: i for i, libelle in enumerate(self.libelles)}
+        # Titre nu → positions de tous les films qui le portent
+        self._par_titre = pd.Series(np.arange(len(self.titres))).groupby(self.titres, sort=False).indices
+        self._par_id = None
+
+    def __len__(self):
+        return len(self.titres)
+
+    def __contains__(self, libelle):
+        return libelle in self._par_libelle or libelle in self._par_titre
+
+    # Position d'un film : libellé exact, sinon premier film portant ce titre
+    def position(self, libelle):
+        position = self._par_libelle.get(libelle)
+        if position is None:
+            positions = self._par_titre.get(libelle)
+            if positions is None:
+                raise KeyError(libelle)
+            position = positions[0]
+        return int(position)
+
+    # Position d'un film à partir de son identifiant TMDB (index construit au premier appel)
+    def position_id(self, film_id):
+        if self._par_id is None:
+            self._par_id = {str(film_id): i for i, film_id in enumerate(self.ids)}
+        return self._par_id[str(film_id)]
+
+    # (titre, lien de l'affiche, ID_film) pour chaque position demandée
+    def resultats(self, positions):
+        positions = np.asarray(positions, dtype=np.intp)
+        return list(zip(
+            np.take(self.titres, positions), np.take(self.liens, positions), np.take(self.ids, positions)
+        ))
@@ -0,0 +1,224 @@
+import contextlib
+import contextvars
+import cProfile
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# DECODEX_METRIQUES=0 désactive les mesures de durée (les compteurs restent tenus)
+ACTIVEES = os.getenv("DECODEX_METRIQUES", "1") != "0"
+
+# Dossier des profils cProfile (un fichier .prof par requête profilée) ; vide : pas de profilage
+DOSSIER_PROFILS = os.getenv("DECODEX_PROFIL")
+
+# Port de l'exportateur Prometheus autonome (application Streamlit) ; vide : pas d'exportateur
+PORT_PROMETHEUS = os.getenv("DECODEX_METRIQUES_PORT")
+
+# Adresse d'écoute de l'exportateur : locale par défaut, 0.0.0.0 pour l'exposer hors de la machine
+HOTE_PROMETHEUS = os.getenv("DECODEX_METRIQUES_HOTE", "127.0.0.1")
+
+# Bornes (en secondes) des histogrammes de durée
+BORNES_DUREES = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _cle(nom, etiquettes):
+    return nom, tuple(sorted((cle, str(valeur)) for cle, valeur in etiquettes.items()))
+
+
+def _format_etiquettes(etiquettes, supplementaires=()):
+    paires = list(etiquettes) + list(supplementaires)
+    if not paires:
+        return ""
+    return "{" + ",".join(f'{cle}="{str(valeur)}"' for cle, valeur in paires) + "}"
+
+
+class Registre:
+    """Compteurs, jauges et histogrammes de durée du processus, partagés par tous les threads.
+
+    Chaque série est identifiée par un nom et des étiquettes (`etat="frais"`, …),
+    comme dans Prometheus ; `exporter_prometheus` produit le format texte d'exposition.
+    """
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self.compteurs = {}
+        self.jauges = {}
+        self.histogrammes = {}
+
+    def incrementer(self, nom, valeur=1, **etiquettes):
+        cle = _cle(nom, etiquettes)
+        with self._verrou:
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+
+    def fixer(self, nom, valeur, **etiquettes):
+        with self._verrou:
+            self.jauges[_cle(nom, etiquettes)] = valeur
+
+    def observer(self, nom, duree, **etiquettes):
+        cle = _cle(nom, etiquettes)
+        with self._verrou:
+            histogramme = self.histogrammes.get(cle)
+            if histogramme is None:
+                histogramme = self.histogrammes[cle] = {"seaux": [0] * len(BORNES_DUREES), "somme": 0.0, "nb": 0}
+            for i, borne in enumerate(BORNES_DUREES):
+                if duree <= borne:
+                    histogramme["seaux"][i] += 1
+                    break
+            histogramme["somme"] += duree
+            histogramme["nb"] += 1
+
+    # Valeur d'un compteur (somme sur toutes les étiquettes si aucune n'est précisée)
+    def valeur(self, nom, **etiquettes):
+        with self._verrou:
+            if etiquettes:
+                return self.compteurs.get(_cle(nom, etiquettes), 0)
+            return sum(valeur for (n, _), valeur in self.compteurs.items() if n == nom)
+
+    # Séries sous forme de listes de dictionnaires (panneau de débogage, JSON)
+    def instantane(self):
+        with self._verrou:
+            return {
+                "compteurs": [
+                    {"nom": nom, **dict(etiquettes), "valeur": valeur}
+                    for (nom, etiquettes), valeur in sorted(self.compteurs.items())
+                ],
+                "jauges": [
+                    {"nom": nom, **dict(etiquettes), "valeur": valeur}
+                    for (nom, etiquettes), valeur in sorted(self.jauges.items())
+                ],
+                "durees": [
+                    {"nom": nom, **dict(etiquettes), "nb": h["nb"], "moyenne_ms": 1000 * h["somme"] / h["nb"]}
+                    for (nom, etiquettes), h in sorted(self.histogrammes.items()) if h["nb"]
+                ],
+            }
+
+    def exporter_prometheus(self):
+        lignes = []
+        with self._verrou:
+            for (nom, etiquettes), valeur in sorted(self.compteurs.items()):
+                lignes.append(f"{nom}{_format_etiquettes(etiquettes)} {valeur}")
+            for (nom, etiquettes), valeur in sorted(self.jauges.items()):
+                lignes.append(f"{nom}{_format_etiquettes(etiquettes)} {valeur}")
+            for (nom, etiquettes), histogramme in sorted(self.histogrammes.items()):
+                cumul = 0
+                for borne, nb in zip(BORNES_DUREES, histogramme["seaux"]):
+                    cumul += nb
+                    lignes.append(f"{nom}_bucket{_format_etiquettes(etiquettes, [('le', borne)])} {cumul}")
+                lignes.append(f"{nom}_bucket{_format_etiquettes(etiquettes, [('le', '+Inf')])} {histogramme['nb']}")
+                lignes.append(f"{nom}_sum{_format_etiquettes(etiquettes)} {histogramme['somme']}")
+                lignes.append(f"{nom}_count{_format_etiquettes(etiquettes)} {histogramme['nb']}")
+        return "\n".join(lignes) + "\n"
+
+    def reinitialiser(self):
+        with self._verrou:
+            self.compteurs.clear()
+            self.jauges.clear()
+            self.histogrammes.clear()
+
+
+# Registre du processus
+registre = Registre()
+
+
+def compter(nom, valeur=1, **etiquettes):
+    registre.incrementer(nom, valeur, **etiquettes)
+
+
+def jauge(nom, valeur, **etiquettes):
+    registre.fixer(nom, valeur, **etiquettes)
+
+
+class Trace:
+    """Décomposition d'une requête : durée de chaque étape exécutée dans son contexte."""
+
+    def __init__(self, nom):
+        self.nom = nom
+        self.etapes = []
+        self.duree = None
+
+
+_trace_courante = contextvars.ContextVar("trace_courante", default=None)
+_verrou_profil = threading.Lock()
+
+
+@contextlib.contextmanager
+def etape(nom):
+    """Mesure la durée d'une étape : histogramme `decodex_etape_duree_secondes` et trace en cours."""
+    if not ACTIVEES:
+        yield
+        return
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        duree = time.perf_counter() - debut
+        registre.observer("decodex_etape_duree_secondes", duree, etape=nom)
+        trace_courante = _trace_courante.get()
+        if trace_courante is not None:
+            trace_courante.etapes.append((nom, duree))
+
+
+@contextlib.contextmanager
+def trace(nom):
+    """Ouvre une trace de requête (étapes imbriquées comprises) et observe sa durée totale."""
+    nouvelle = Trace(nom)
+    jeton = _trace_courante.set(nouvelle)
+    debut = time.perf_counter()
+    try:
+        with profiler(nom):
+            yield nouvelle
+    finally:
+        nouvelle.duree = time.perf_counter() - debut
+        _trace_courante.reset(jeton)
+        registre.observer("decodex_requete_duree_secondes", nouvelle.duree, requete=nom)
+
+
+@contextlib.contextmanager
+def profiler(nom):
+    """Profil cProfile de la requête dans DOSSIER_PROFILS (à lire avec `python -m pstats`), si défini.
+
+    Un seul profil à la fois par processus : une requête concurrente n'est pas profilée.
+    """
+    if not DOSSIER_PROFILS or not _verrou_profil.acquire(blocking=False):
+        yield
+        return
+    profil = cProfile.Profile()
+    profil.enable()
+    try:
+        yield
+    finally:
+        profil.disable()
+        _verrou_profil.release()
+        os.makedirs(DOSSIER_PROFILS, exist_ok=True)
+        fichier = f"{nom.strip('/').replace('/', '_')}-{os.getpid()}-{time.time_ns()}.prof"
+        profil.dump_stats(os.path.join(DOSSIER_PROFILS, fichier))
+
+
+# Jauges mémoire (octets) des structures du recommandeur, à rafraîchir après chaque chargement
+def mesurer_memoire(recommandeur):
+    for composant, octets in recommandeur.memoire().items():
+        jauge("decodex_memoire_octets", octets, composant=composant)
+
+
+class _GestionnaireMetriques(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        contenu = registre.exporter_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(contenu)))
+        self.end_headers()
+        self.wfile.write(contenu)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def demarrer_exportateur(port=PORT_PROMETHEUS, hote=HOTE_PROMETHEUS):
+    """Sert /metrics au format texte Prometheus dans un thread d'arrière-plan."""
+    serveur = ThreadingHTTPServer((hote, int(port)), _GestionnaireMetriques)
+    serveur.daemon_threads = True
+    threading.Thread(target=serveur.serve_forever, name="metriques", daemon=True).start()
+    return serveur
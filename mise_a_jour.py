@@ -0,0 +1,219 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from artefact import ecrire_artefact, ouvrir_artefact
+from donnees import lire_catalogue
+from similarite import MoteurSimilarite, normaliser_l2, produits_scalaires, selectionner_top_n
+
+
+# Réindexation des colonnes d'une matrice sur le vocabulaire de l'artefact ;
+# les colonnes DIR_/ACT_ inconnues sont ajoutées à la fin du vocabulaire
+def aligner_colonnes(matrice, colonnes, vocabulaire):
+    vocabulaire = list(vocabulaire)
+    positions = {col: j for j, col in enumerate(vocabulaire)}
+    for col in colonnes:
+        if col not in positions:
+            positions[col] = len(vocabulaire)
+            vocabulaire.append(col)
+    correspondance = np.array([positions[col] for col in colonnes], dtype=np.int64)
+    matrice = sp.csr_matrix(matrice)
+    alignee = sp.csr_matrix(
+        (matrice.data, correspondance[matrice.indices], matrice.indptr),
+        shape=(matrice.shape[0], len(vocabulaire)),
+    )
+    alignee.sort_indices()
+    return alignee, vocabulaire
+
+
+# Fusion de nouveaux candidats (colonnes `candidats` / `scores_candidats`) dans des listes de voisins
+def fusionner_voisins(voisins, scores, candidats, scores_candidats):
+    tous = np.concatenate([voisins, candidats], axis=1)
+    tous_scores = np.concatenate([scores, scores_candidats], axis=1)
+    ordre = selectionner_top_n(tous_scores, voisins.shape[1])
+    return np.take_along_axis(tous, ordre, axis=1), np.take_along_axis(tous_scores, ordre, axis=1)
+
+
+def mettre_a_jour_voisins(vecteurs, voisins, scores_voisins, modifies, taille_bloc=256):
+    """Met à jour la table des K plus proches voisins après ajout ou remplacement des lignes `modifies`.
+
+    Seules les similarités des lignes modifiées avec le catalogue sont calculées :
+    - les lignes modifiées reçoivent une liste entièrement recalculée ;
+    - les autres lignes intègrent les lignes modifiées qui entrent dans leur top-K ;
+    - une ligne dont la liste contenait une ligne modifiée est recalculée entièrement,
+      car le voisin suivant (hors de la table) peut désormais y entrer.
+    `voisins` et `scores_voisins` couvrent les anciennes lignes ; les lignes ajoutées
+    sont celles au-delà de leur longueur.
+    """
+    nb_films = vecteurs.shape[0]
+    k = voisins.shape[1]
+    modifies = np.unique(np.asarray(modifies, dtype=np.intp))
+    est_modifie = np.zeros(nb_films, dtype=bool)
+    est_modifie[modifies] = True
+
+    # Lignes ajoutées : listes vides à remplir
+    nb_ajouts = nb_films - voisins.shape[0]
+    voisins = np.concatenate([np.asarray(voisins), np.zeros((nb_ajouts, k), dtype=voisins.dtype)])
+    scores_voisins = np.concatenate(
+        [np.asarray(scores_voisins), np.full((nb_ajouts, k), -np.inf, dtype=scores_voisins.dtype)]
+    )
+
+    # Lignes à recalculer entièrement : lignes modifiées et lignes qui pointaient vers elles
+    a_recalculer = est_modifie | est_modifie[voisins].any(axis=1)
+    a_recalculer[nb_films - nb_ajouts:] = True
+    a_patcher = ~a_recalculer
+
+    for debut in range(0, len(modifies), taille_bloc):
+        bloc = modifies[debut:debut + taille_bloc]
+        scores_bloc = produits_scalaires(vecteurs[bloc], vecteurs)  # |bloc| × N
+
+        # Sens inverse : les lignes modifiées entrent-elles dans le top-K des autres lignes ?
+        seuils = scores_voisins[:, -1]
+        ameliorees = np.flatnonzero(a_patcher & (scores_bloc > seuils[None, :]).any(axis=0))
+        if len(ameliorees):
+            candidats = np.broadcast_to(bloc, (len(ameliorees), len(bloc)))
+            voisins[ameliorees], scores_voisins[ameliorees] = fusionner_voisins(
+                voisins[ameliorees], scores_voisins[ameliorees], candidats, scores_bloc[:, ameliorees].T
+            )
+
+    # Recalcul complet (par blocs) des lignes modifiées et des lignes qui les avaient pour voisines
+    lignes = np.flatnonzero(a_recalculer)
+    for debut in range(0, len(lignes), taille_bloc):
+        bloc = lignes[debut:debut + taille_bloc]
+        scores_bloc = produits_scalaires(vecteurs[bloc], vecteurs)
+        top = selectionner_top_n(scores_bloc, k, exclure=bloc)
+        voisins[bloc] = top
+        scores_voisins[bloc] = np.take_along_axis(scores_bloc, top, axis=1)
+
+    return voisins, scores_voisins, lignes
+
+
+def lignes_concernees(vecteurs, voisins, scores_voisins, modifies, taille_bloc=256, tolerance=1e-5):
+    """Lignes dont la liste de voisins peut dépendre des lignes `modifies`.
+
+    Ce sont les lignes modifiées, celles qui en ont une parmi leurs voisins et celles
+    dans le top-K desquelles une ligne modifiée devrait entrer (score au moins égal au
+    dernier score de la liste) ; les autres lignes sont inchangées par construction.
+    """
+    modifies = np.unique(np.asarray(modifies, dtype=np.intp))
+    concernees = np.zeros(vecteurs.shape[0], dtype=bool)
+    concernees[modifies] = True
+    concernees |= np.isin(voisins, modifies).any(axis=1)
+    seuils = np.asarray(scores_voisins)[:, -1] - tolerance
+    for debut in range(0, len(modifies), taille_bloc):
+        bloc = modifies[debut:debut + taille_bloc]
+        scores_bloc = produits_scalaires(vecteurs[bloc], vecteurs)
+        scores_bloc[np.arange(len(bloc)), bloc] = -np.inf
+        concernees |= (scores_bloc >= seuils[None, :]).any(axis=0)
+    return np.flatnonzero(concernees)
+
+
+def verifier_voisins(vecteurs, voisins, scores_voisins, lignes, taille_bloc=256, tolerance=1e-5):
+    """Compare les listes des `lignes` à un recalcul exact par MoteurSimilarite ; retourne les lignes en écart.
+
+    Une ligne est correcte si ses scores enregistrés sont ceux de ses voisins, sans
+    doublon ni le film lui-même, et si ses scores triés sont ceux du recalcul exact :
+    seul l'ordre (ou le choix) des voisins à score égal peut différer.
+    """
+    reference = MoteurSimilarite.depuis_vecteurs(vecteurs)
+    k = voisins.shape[1]
+    lignes = np.asarray(lignes, dtype=np.intp)
+    ecarts = []
+    for debut in range(0, len(lignes), taille_bloc):
+        bloc = lignes[debut:debut + taille_bloc]
+        scores = reference.scores(bloc)
+        voisins_bloc = np.asarray(voisins[bloc], dtype=np.intp)
+        scores_bloc = np.asarray(scores_voisins[bloc], dtype=np.float64)
+        attendus = np.take_along_axis(scores, selectionner_top_n(scores, k, exclure=bloc), axis=1)
+        obtenus = np.take_along_axis(scores, voisins_bloc, axis=1)
+
+        triees = np.sort(voisins_bloc, axis=1)
+        doublons = (triees[:, 1:] == triees[:, :-1]).any(axis=1) | (voisins_bloc == bloc[:, None]).any(axis=1)
+        incoherents = (np.abs(obtenus - scores_bloc) > tolerance).any(axis=1)
+        differents = (np.abs(np.sort(obtenus, axis=1) - np.sort(attendus, axis=1)) > tolerance).any(axis=1)
+        ecarts.append(bloc[doublons | incoherents | differents])
+    return np.concatenate(ecarts) if ecarts else np.empty(0, dtype=np.intp)
+
+
+def appliquer_mise_a_jour(dossier, chemin_delta, taille_bloc=256, verifier=False, afficher=print):
+    """Ajoute ou remplace (par ID_film) les films du TSV `chemin_delta` et publie une nouvelle version.
+
+    La nouvelle version est écrite à côté de l'actuelle puis publiée atomiquement
+    (fichier ACTUEL) : les processus qui servent l'ancienne version continuent de la
+    lire jusqu'à ce qu'ils rouvrent l'artefact.
+    Avec `verifier`, les listes des lignes concernées par le delta sont comparées à un
+    recalcul exact avant publication ; un écart lève une erreur et rien n'est publié.
+    """
+    debut = time.perf_counter()
+    artefact = ouvrir_artefact(dossier)
+    if not artefact.manifest["k_voisins"]:
+        raise ValueError("La mise à jour incrémentale nécessite un artefact avec voisins précalculés")
+    moteur = artefact.moteur
+    df = artefact.metadonnees
+
+    df_delta, features_delta, colonnes_delta = lire_catalogue(chemin_delta)
+    features_delta, vocabulaire = aligner_colonnes(features_delta, colonnes_delta, artefact.manifest["colonnes_features"])
+    vecteurs_delta = normaliser_l2(features_delta)
+
+    # Remplacement des films déjà présents (même ID_film), ajout des autres à la fin
+    nb_films = len(df)
+    positions_existantes = pd.Series(np.arange(nb_films), index=df["ID_film"].astype(str).to_numpy())
+    positions_existantes = positions_existantes[~positions_existantes.index.duplicated()]
+    positions_delta = np.array(positions_existantes.reindex(df_delta["ID_film"].astype(str).to_numpy()), dtype=np.float64)
+    nouveaux = np.isnan(positions_delta)
+    remplaces = ~nouveaux
+    positions_delta[nouveaux] = nb_films + np.arange(nouveaux.sum())
+    positions_delta = positions_delta.astype(np.intp)
+
+    # Anciennes lignes suivies des lignes du delta, puis sélection de la bonne source pour chaque position
+    sources = np.arange(nb_films + int(nouveaux.sum()))
+    sources[positions_delta] = nb_films + np.arange(len(df_delta))
+    anciens_vecteurs = sp.csr_matrix(
+        (moteur.vecteurs.data, moteur.vecteurs.indices, moteur.vecteurs.indptr),
+        shape=(nb_films, len(vocabulaire)),
+    )
+    vecteurs = sp.vstack([anciens_vecteurs, vecteurs_delta], format="csr")[sources]
+    colonnes = [col for col in df.columns if col in df_delta.columns]
+    df = pd.concat([df, df_delta[colonnes]], ignore_index=True).iloc[sources].reset_index(drop=True)
+
+    voisins, scores_voisins, recalcules = mettre_a_jour_voisins(
+        vecteurs, moteur.voisins, moteur.scores_voisins, positions_delta, taille_bloc
+    )
+    if verifier:
+        lignes = lignes_concernees(vecteurs, voisins, scores_voisins, positions_delta, taille_bloc)
+        ecarts = verifier_voisins(vecteurs, voisins, scores_voisins, lignes, taille_bloc)
+        if len(ecarts):
+            raise ValueError(
+                f"Vérification échouée : {len(ecarts)} listes de voisins sur {len(lignes)} diffèrent du recalcul exact "
+                f"(lignes {', '.join(map(str, ecarts[:10]))}{', …' if len(ecarts) > 10 else ''})"
+            )
+        afficher(f"Vérification : {len(lignes)} listes de voisins conformes au recalcul exact")
+    nouveau_moteur = MoteurSimilarite.depuis_vecteurs(vecteurs, voisins.astype(np.int32), scores_voisins)
+    version = ecrire_artefact(
+        dossier, df, nouveau_moteur, vocabulaire,
+        source=chemin_delta, parent=artefact.version,
+    )
+    afficher(
+        f"Version {version} publiée : {int(nouveaux.sum())} films ajoutés, {int(remplaces.sum())} remplacés, "
+        f"{len(recalcules)} listes recalculées, {len(vocabulaire) - len(artefact.manifest['colonnes_features'])} "
+        f"nouvelles colonnes, en {time.perf_counter() - debut:.1f} s"
+    )
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajoute ou met à jour des films dans l'artefact sans tout recalculer.")
+    parser.add_argument("--artefact", default="artefacts", help="Dossier des artefacts")
+    parser.add_argument("delta", help="TSV des films ajoutés ou modifiés (même format que le catalogue)")
+    parser.add_argument("--taille-bloc", type=int, default=256, help="Nombre de lignes scorées à la fois")
+    parser.add_argument("--verifier", action="store_true",
+                        help="Compare les listes modifiées à un recalcul exact avant de publier la version")
+    args = parser.parse_args()
+    appliquer_mise_a_jour(args.artefact, args.delta, args.taille_bloc, verifier=args.verifier)
+
+
+if __name__ == "__main__":
+    main()
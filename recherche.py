@@ -0,0 +1,94 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+# Taille des n-grammes de caractères utilisés pour la recherche approchée
+TAILLE_NGRAMME = 3
+
+_NON_ALPHANUMERIQUE = re.compile(r"[^0-9a-z]+")
+
+
+# Forme normalisée d'un titre : sans accents, en minuscules, ponctuation remplacée par des espaces
+def normaliser(texte):
+    texte = unicodedata.normalize("NFKD", str(texte))
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    return _NON_ALPHANUMERIQUE.sub(" ", texte.casefold()).strip()
+
+
+# N-grammes d'un texte normalisé (bordé d'espaces pour favoriser les débuts et fins de mots)
+def ngrammes(texte_normalise, taille=TAILLE_NGRAMME):
+    texte = f" {texte_normalise} "
+    return {texte[i:i + taille] for i in range(max(1, len(texte) - taille + 1))}
+
+
+class RechercheTitres:
+    """Recherche incrémentale dans les libellés du catalogue, construite une fois au chargement.
+
+    1. Préfixe : tableau trié des titres normalisés, interrogé par `np.searchsorted`.
+    2. Approché : index inversé de trigrammes ; les candidats sont classés par
+       nombre de trigrammes communs avec la requête (tolère fautes et mots manquants).
+    Les résultats sont des positions dans le catalogue.
+    """
+
+    def __init__(self, libelles):
+        self.libelles = np.asarray(libelles, dtype=object)
+        self.normalises = np.array([normaliser(libelle) for libelle in self.libelles], dtype=object)
+
+        # Tableau trié pour la recherche par préfixe
+        self.ordre = np.argsort(self.normalises, kind="stable")
+        self.cles_triees = self.normalises[self.ordre]
+
+        # Index inversé : trigramme → positions des titres qui le contiennent
+        postings = defaultdict(list)
+        for position, texte in enumerate(self.normalises):
+            for ngramme in ngrammes(texte):
+                postings[ngramme].append(position)
+        self.index_ngrammes = {ngramme: np.array(positions, dtype=np.int32) for ngramme, positions in postings.items()}
+        self.nb_ngrammes = np.array([len(ngrammes(texte)) for texte in self.normalises], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.libelles)
+
+    # Positions des titres commençant par le préfixe (normalisé), dans l'ordre alphabétique
+    def prefixe(self, requete_normalisee, masque=None, limite=20):
+        debut = np.searchsorted(self.cles_triees, requete_normalisee, side="left")
+        fin = np.searchsorted(self.cles_triees, requete_normalisee + "\uffff", side="left")
+        positions = self.ordre[debut:fin]
+        if masque is not None:
+            positions = positions[masque[positions]]
+        return positions[:limite]
+
+    # Positions des titres partageant le plus de trigrammes avec la requête
+    def approchee(self, requete_normalisee, masque=None, limite=20, score_minimum=0.3):
+        ngrammes_requete = [n for n in ngrammes(requete_normalisee) if n in self.index_ngrammes]
+        if not ngrammes_requete:
+            return np.empty(0, dtype=np.intp)
+        candidats = np.concatenate([self.index_ngrammes[n] for n in ngrammes_requete])
+        communs = np.bincount(candidats, minlength=len(self.libelles))
+
+        # Coefficient de Dice entre les trigrammes de la requête et ceux du titre
+        scores = 2 * communs / (len(ngrammes(requete_normalisee)) + self.nb_ngrammes)
+        if masque is not None:
+            scores = np.where(masque, scores, 0.0)
+        retenus = np.flatnonzero(scores >= score_minimum)
+        if len(retenus) > limite:
+            retenus = retenus[np.argpartition(-scores[retenus], limite - 1)[:limite]]
+        return retenus[np.lexsort((retenus, -scores[retenus]))]
+
+    def rechercher(self, requete, masque=None, limite=20):
+        """Positions des meilleurs titres pour une saisie : préfixes d'abord, puis correspondances approchées."""
+        requete_normalisee = normaliser(requete)
+        if not requete_normalisee:
+            return np.empty(0, dtype=np.intp)
+        positions = self.prefixe(requete_normalisee, masque, limite)
+        if len(positions) < limite:
+            approchees = self.approchee(requete_normalisee, masque, limite)
+            approchees = approchees[~np.isin(approchees, positions)]
+            positions = np.concatenate([positions, approchees])[:limite]
+        return positions
+
+    # Libellés des meilleurs titres, prêts pour un sélecteur
+    def suggestions(self, requete, masque=None, limite=20):
+        return self.libelles[self.rechercher(requete, masque, limite)].tolist()
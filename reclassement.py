@@ -0,0 +1,148 @@
+import numpy as np
+
+from genres import _BITS_PAR_OCTET, GENRES, BitmapsGenres
+from similarite import produits_scalaires
+
+# Nombre de candidats récupérés par similarité cosinus avant reclassement
+NB_CANDIDATS = 300
+
+# Critères du reclassement et poids par défaut (similarité seule : même classement que le cosinus)
+POIDS_RECLASSEMENT = {
+    "similarite": 1.0,
+    "popularite": 0.0,
+    "note": 0.0,
+    "recence": 0.0,
+    "genres": 0.0,
+}
+
+
+# Mise à l'échelle [0, 1] d'une colonne (valeurs manquantes à 0)
+def _echelle(valeurs):
+    valeurs = np.asarray(valeurs, dtype=np.float32)
+    if np.isnan(valeurs).all():
+        return np.zeros(len(valeurs), dtype=np.float32)
+    minimum, maximum = np.nanmin(valeurs), np.nanmax(valeurs)
+    if maximum <= minimum:
+        return np.zeros(len(valeurs), dtype=np.float32)
+    return np.nan_to_num((valeurs - minimum) / (maximum - minimum), nan=0.0).astype(np.float32)
+
+
+class SignauxFilms:
+    """Signaux par film du reclassement, calculés une seule fois à partir du catalogue.
+
+    - popularite : log(1 + Nb_votants), ramené entre 0 et 1 ;
+    - note : Note_moyenne ramenée entre 0 et 1 ;
+    - recence : Annee_sortie ramenée entre 0 et 1 (1 pour les films les plus récents) ;
+    - genres : genres du film sur un octet (un bit par genre, repris des bitsets de BitmapsGenres),
+      pour la concordance avec le film requête.
+    Une colonne absente du catalogue donne un signal nul.
+    """
+
+    def __init__(self, df, genres=GENRES):
+        nb_films = len(df)
+
+        def colonne(nom):
+            if nom not in df.columns:
+                return np.full(nb_films, np.nan, dtype=np.float32)
+            return df[nom].to_numpy(dtype=np.float32, na_value=np.nan)
+
+        self.popularite = _echelle(np.log1p(np.clip(colonne("Nb_votants"), 0, None)))
+        self.note = _echelle(colonne("Note_moyenne"))
+        self.recence = _echelle(colonne("Annee_sortie"))
+
+        self.genres = np.zeros(nb_films, dtype=np.uint8)
+        for bit, bitset in enumerate(BitmapsGenres(df, genres).bitsets.values()):
+            self.genres |= np.unpackbits(bitset, count=nb_films) << bit
+
+    def __len__(self):
+        return len(self.genres)
+
+    # Indice de Jaccard entre les genres du film requête et ceux de chaque candidat
+    def concordance_genres(self, index, candidats):
+        requete = self.genres[index]
+        communs = _BITS_PAR_OCTET[self.genres[candidats] & requete]
+        reunis = _BITS_PAR_OCTET[self.genres[candidats] | requete]
+        return np.where(reunis > 0, communs / np.maximum(reunis, 1), 0.0).astype(np.float32)
+
+    # Matrice candidats × critères (colonnes dans l'ordre de POIDS_RECLASSEMENT), toutes entre 0 et 1.
+    # La similarité est ramenée entre 0 et 1 parmi les candidats : les cosinus des candidats ne
+    # diffèrent souvent que d'environ 1e-3, un poids même faible sur un autre critère l'écraserait sinon
+    def criteres(self, index, candidats, similarites):
+        return np.column_stack([
+            _echelle(similarites),
+            self.popularite[candidats],
+            self.note[candidats],
+            self.recence[candidats],
+            self.concordance_genres(index, candidats),
+        ])
+
+
+def verifier_poids(poids):
+    """Poids complets (valeurs par défaut pour les critères absents) ; erreur sur un critère inconnu."""
+    poids = dict(poids or {})
+    inconnus = set(poids) - set(POIDS_RECLASSEMENT)
+    if inconnus:
+        raise ValueError(f"Critères de reclassement inconnus : {', '.join(sorted(inconnus))}")
+    return {critere: float(poids.get(critere, defaut)) for critere, defaut in POIDS_RECLASSEMENT.items()}
+
+
+# Similarités entre candidats ramenées entre 0 et 1 sur les paires distinctes, comme la pertinence :
+# les cosinus bruts des candidats sont tous proches de 1 et la redondance ne départagerait rien
+def _similarites_mutuelles(produits):
+    produits = np.asarray(produits, dtype=np.float32)
+    hors_diagonale = ~np.eye(len(produits), dtype=bool)
+    mutuelles = np.ones_like(produits)
+    mutuelles[hors_diagonale] = _echelle(produits[hors_diagonale])
+    return mutuelles
+
+
+def diversifier(pertinences, similarites_mutuelles, n, diversite):
+    """Sélection gloutonne MMR (Maximal Marginal Relevance) de n candidats.
+
+    À chaque étape, le candidat retenu maximise
+    (1 - diversite) · pertinence - diversite · (similarité maximale avec les films déjà retenus).
+    """
+    nb = len(pertinences)
+    n = min(n, nb)
+    retenus = np.empty(n, dtype=np.intp)
+    disponibles = np.ones(nb, dtype=bool)
+    redondance = np.zeros(nb, dtype=np.float64)
+    for rang in range(n):
+        scores = (1 - diversite) * pertinences - diversite * redondance
+        scores[~disponibles] = -np.inf
+        choisi = int(np.argmax(scores))
+        retenus[rang] = choisi
+        disponibles[choisi] = False
+        np.maximum(redondance, similarites_mutuelles[choisi], out=redondance)
+    return retenus
+
+
+def reclasser(moteur, signaux, index, n, poids=None, diversite=0.0, masque=None, nb_candidats=NB_CANDIDATS):
+    """Recommandations en deux étapes pour le film `index`.
+
+    1. les `nb_candidats` films les plus similaires (cosinus) sont récupérés par le moteur ;
+    2. ils sont reclassés par une combinaison linéaire des critères (similarité, popularité,
+       note, récence, concordance des genres) avec les `poids` de la requête, puis
+       éventuellement diversifiés (MMR) si `diversite` > 0.
+    Aucune similarité n'est recalculée sur le catalogue : seuls les candidats sont notés.
+    """
+    if not 0 <= diversite < 1:
+        raise ValueError("La diversité doit être comprise entre 0 et 1 (exclu)")
+    poids = verifier_poids(poids)
+    candidats, similarites = moteur.candidats(index, max(nb_candidats, n), masque=masque)
+    if len(candidats) == 0:
+        return candidats
+
+    vecteur_poids = np.array(list(poids.values()), dtype=np.float32)
+    pertinences = signaux.criteres(index, candidats, similarites) @ vecteur_poids
+
+    if diversite > 0:
+        if moteur.vecteurs is None:
+            raise ValueError("La diversification nécessite les vecteurs du moteur")
+        vecteurs_candidats = moteur.vecteurs[candidats]
+        similarites_mutuelles = _similarites_mutuelles(produits_scalaires(vecteurs_candidats, vecteurs_candidats))
+        return candidats[diversifier(_echelle(pertinences), similarites_mutuelles, n, diversite)]
+
+    # Tri décroissant stable : à pertinence égale, l'ordre cosinus est conservé
+    ordre = np.argsort(-pertinences, kind="stable")[:n]
+    return candidats[ordre]
@@ -0,0 +1,232 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from artefact import ouvrir_artefact
+from caracteristiques import construire_features, poids
+from index_titres import IndexTitres
+from metriques import etape
+from reclassement import SignauxFilms, reclasser
+from similarite import MoteurSimilarite, selectionner_top_n
+
+
+# Titre ou identifiant absent du catalogue
+class FilmInconnu(KeyError):
+    pass
+
+
+class Recommandeur:
+    """Recommandations par similarité de contenu, indépendantes de l'interface Streamlit.
+
+    Regroupe le catalogue (`df`), l'index des titres et le moteur de similarité ;
+    se construit à partir d'un catalogue chargé ou d'un artefact précalculé.
+    """
+
+    def __init__(self, df, index_titres, moteur):
+        self.df = df
+        self.index_titres = index_titres
+        self.moteur = moteur
+        self._signaux = None
+
+    # Signaux par film du reclassement (popularité, note, récence, genres), calculés au premier usage
+    @property
+    def signaux(self):
+        if self._signaux is None:
+            self._signaux = SignauxFilms(self.df)
+        return self._signaux
+
+    @classmethod
+    def depuis_catalogue(cls, df, k_voisins=None, features=None, precision="float64", colonnes=None):
+        if features is None:
+            features, colonnes = construire_features(df, poids)
+        moteur = MoteurSimilarite(features, k_voisins=k_voisins, precision=precision, colonnes=colonnes)
+        return cls(df, IndexTitres(df), moteur)
+
+    @classmethod
+    def depuis_artefact(cls, dossier, precision=None):
+        artefact = ouvrir_artefact(dossier)
+        if precision is not None:
+            artefact.moteur.configurer_precision(precision)
+        return cls(artefact.metadonnees, artefact.index_titres, artefact.moteur)
+
+    def __len__(self):
+        return len(self.index_titres)
+
+    def position(self, titre=None, film_id=None):
+        try:
+            if film_id is not None:
+                return self.index_titres.position_id(film_id)
+            return self.index_titres.position(titre)
+        except KeyError:
+            raise FilmInconnu(titre if film_id is None else film_id) from None
+
+    # (titre, lien de l'affiche, ID_film) des n films les plus similaires ; avec `poids` ou `diversite`,
+    # les candidats cosinus sont reclassés selon la popularité, la note, la récence et les genres
+    # (voir reclassement.reclasser)
+    def recommander(self, titre=None, n=5, film_id=None, masque=None, poids=None, diversite=0.0):
+        with etape("recherche_titre"):
+            position = self.position(titre, film_id)
+        if poids is None and not diversite:
+            with etape("similarite"):
+                voisins = self.moteur.top_n(position, n, masque=masque)
+        else:
+            with etape("reclassement"):
+                voisins = reclasser(self.moteur, self.signaux, position, n, poids, diversite, masque=masque)
+        with etape("lecture_resultats"):
+            return self.index_titres.resultats(voisins)
+
+    # Mémoire (octets) du catalogue et des structures du moteur
+    def memoire(self):
+        return {"catalogue": int(self.df.memory_usage(deep=True).sum()), **self.moteur.memoire()}
+
+    # Voisins et scores d'un bloc de films : une multiplication matricielle pour tout le bloc
+    def voisins_bloc(self, positions, n):
+        positions = np.asarray(positions, dtype=np.intp)
+        moteur = self.moteur
+        if moteur.voisins is not None and (n <= moteur.voisins.shape[1] or moteur.vecteurs is None):
+            return np.asarray(moteur.voisins[positions, :n]), np.asarray(moteur.scores_voisins[positions, :n])
+        scores = moteur.scores(positions)
+        voisins = selectionner_top_n(scores, n, exclure=positions)
+        return voisins, np.take_along_axis(scores, voisins, axis=1).astype(np.float32)
+
+
+# Nombre de films par bloc pour que la matrice de scores et les tableaux de travail de la sélection
+# (copie float64, scores négés pour argpartition, indices intp) tiennent dans le budget : ~32 octets par score
+def taille_bloc(nb_films, budget_memoire_mo):
+    return max(1, int(budget_memoire_mo * 2**20 // (nb_films * 8 * 4)))
+
+
+# Mise à plat d'un bloc : une ligne par couple (film, voisin)
+def bloc_en_dataframe(recommandeur, positions, voisins, scores):
+    index_titres = recommandeur.index_titres
+    n = voisins.shape[1]
+    sources = np.repeat(positions, n)
+    cibles = voisins.ravel()
+    return pd.DataFrame({
+        "ID_film": np.take(index_titres.ids, sources),
+        "Titre_original": np.take(index_titres.titres, sources),
+        "rang": np.tile(np.arange(1, n + 1, dtype=np.int16), len(positions)),
+        "ID_voisin": np.take(index_titres.ids, cibles),
+        "Titre_voisin": np.take(index_titres.titres, cibles),
+        "score": scores.ravel(),
+    })
+
+
+class EcrivainResultats:
+    """Écriture des résultats par morceaux, en Parquet ou en CSV selon l'extension du fichier."""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.parquet = chemin.endswith(".parquet")
+        self._ecrivain = None
+        self._premier = True
+
+    def ecrire(self, morceau):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(morceau, preserve_index=False)
+            if self._ecrivain is None:
+                self._ecrivain = pq.ParquetWriter(self.chemin, table.schema)
+            self._ecrivain.write_table(table)
+        else:
+            morceau.to_csv(self.chemin, mode="w" if self._premier else "a", header=self._premier, index=False)
+        self._premier = False
+
+    def fermer(self):
+        if self._ecrivain is not None:
+            self._ecrivain.close()
+
+
+# Recommandeur propre à chaque processus du pool (artefact ouvert en mmap : pages partagées)
+_recommandeur_worker = None
+
+
+def _initialiser_worker(dossier_artefact):
+    global _recommandeur_worker
+    _recommandeur_worker = Recommandeur.depuis_artefact(dossier_artefact)
+
+
+def _calculer_bloc(arguments):
+    positions, n = arguments
+    return (positions, *_recommandeur_worker.voisins_bloc(positions, n))
+
+
+def recommander_lot(recommandeur, positions, n, budget_memoire_mo=512, nb_processus=1, dossier_artefact=None):
+    """Génère (positions, voisins, scores) bloc par bloc pour tous les films demandés.
+
+    Avec `nb_processus` > 1, les blocs sont répartis sur un pool de processus qui
+    ouvrent chacun l'artefact `dossier_artefact` ; les blocs sont rendus dans l'ordre.
+    """
+    positions = np.asarray(positions, dtype=np.intp)
+    taille = taille_bloc(len(recommandeur), budget_memoire_mo)
+    blocs = [(positions[i:i + taille], n) for i in range(0, len(positions), taille)]
+
+    if nb_processus > 1:
+        if dossier_artefact is None:
+            raise ValueError("Le calcul multi-processus nécessite un artefact (dossier_artefact)")
+        with ProcessPoolExecutor(
+            max_workers=nb_processus, initializer=_initialiser_worker, initargs=(dossier_artefact,)
+        ) as executeur:
+            yield from executeur.map(_calculer_bloc, blocs)
+    else:
+        for positions_bloc, n_bloc in blocs:
+            yield (positions_bloc, *recommandeur.voisins_bloc(positions_bloc, n_bloc))
+
+
+# Positions à traiter : titres ou identifiants lus dans un fichier (un par ligne), sinon tout le catalogue
+def positions_demandees(recommandeur, fichier_titres=None, fichier_ids=None, afficher=print):
+    if fichier_titres is None and fichier_ids is None:
+        return np.arange(len(recommandeur))
+    with open(fichier_titres or fichier_ids, encoding="utf-8") as f:
+        valeurs = [ligne.strip() for ligne in f if ligne.strip()]
+    positions = []
+    for valeur in valeurs:
+        try:
+            if fichier_ids:
+                positions.append(recommandeur.position(film_id=valeur))
+            else:
+                positions.append(recommandeur.position(valeur))
+        except FilmInconnu:
+            afficher(f"Film inconnu ignoré : {valeur}")
+    return np.array(positions, dtype=np.intp)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calcule les films similaires pour tout ou partie du catalogue.")
+    parser.add_argument("--artefact", required=True, help="Dossier d'artefact (voir artefact.py)")
+    parser.add_argument("--sortie", required=True, help="Fichier de sortie (.parquet ou .csv)")
+    parser.add_argument("-n", type=int, default=10, help="Nombre de films similaires par film")
+    parser.add_argument("--titres", help="Fichier de titres à traiter (un par ligne)")
+    parser.add_argument("--ids", help="Fichier d'identifiants ID_film à traiter (un par ligne)")
+    parser.add_argument("--budget-memoire", type=int, default=512, help="Mémoire par bloc de scores, en Mo")
+    parser.add_argument("--processus", type=int, default=os.cpu_count(), help="Nombre de processus de calcul")
+    args = parser.parse_args()
+
+    recommandeur = Recommandeur.depuis_artefact(args.artefact)
+    positions = positions_demandees(recommandeur, args.titres, args.ids, afficher=lambda m: print(m, file=sys.stderr))
+
+    ecrivain = EcrivainResultats(args.sortie)
+    debut = time.perf_counter()
+    fait = 0
+    try:
+        for positions_bloc, voisins, scores in recommander_lot(
+            recommandeur, positions, args.n, args.budget_memoire, args.processus, args.artefact
+        ):
+            ecrivain.ecrire(bloc_en_dataframe(recommandeur, positions_bloc, voisins, scores))
+            fait += len(positions_bloc)
+            duree = time.perf_counter() - debut
+            print(f"{fait}/{len(positions)} films traités ({fait / duree:.0f} films/s)", file=sys.stderr)
+    finally:
+        ecrivain.fermer()
+    print(f"{fait} films écrits dans {args.sortie} en {time.perf_counter() - debut:.1f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
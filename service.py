@@ -0,0 +1,511 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from artefact import version_actuelle
+from cache_tmdb import CacheTMDB
+from donnees import charger_catalogue, download_url
+from genres import BitmapsGenres
+from metriques import compter, mesurer_memoire, registre, trace
+from reclassement import reclasser, verifier_poids
+from recommandation import FilmInconnu, Recommandeur
+from tmdb import ClientTMDB
+
+# Noms des champs des détails TMDB (même ordre que tmdb.extraire_details)
+CHAMPS_DETAILS = (
+    "duree", "genres", "synopsis", "date_sortie", "acteurs",
+    "video_url", "realisateur", "note", "budget", "revenu",
+)
+
+# Limites d'une requête : nombre de films similaires et nombre de films par lot
+N_MAXIMUM = 100
+TAILLE_LOT_MAXIMUM = 1000
+
+
+# Requête invalide (paramètre manquant ou hors limites) : réponse 400
+class RequeteInvalide(ValueError):
+    pass
+
+
+# Service pas encore prêt (chargement en cours ou en échec) : réponse 503
+class ServiceIndisponible(RuntimeError):
+    pass
+
+
+def details_en_dict(details):
+    return dict(zip(CHAMPS_DETAILS, details))
+
+
+def resultat_en_dict(resultat):
+    titre, lien, film_id = resultat
+    return {"titre": titre, "lien": lien, "id_film": film_id}
+
+
+class ServiceRecommandation:
+    """État d'un processus du service : recommandeur et client TMDB chargés une seule fois.
+
+    Le chargement se fait en arrière-plan (`demarrer`) : /ready répond 503 tant qu'il
+    n'est pas terminé. Avec un artefact, la version publiée est surveillée toutes les
+    `intervalle_verification` secondes et rechargée dès qu'elle change ; les tableaux
+    étant ouverts en mmap, les processus du service se partagent les mêmes pages.
+    """
+
+    def __init__(self, dossier_artefact=None, source=download_url, precision=None,
+                 api_key=None, intervalle_verification=30):
+        self.dossier_artefact = dossier_artefact
+        self.source = source
+        self.precision = precision
+        self.intervalle_verification = intervalle_verification
+        self.client_tmdb = ClientTMDB(api_key, cache=CacheTMDB())
+        self.erreur = None
+        # (recommandeur, bitmaps des genres, version) remplacés d'un bloc lors d'un rechargement
+        self._etat = None
+        self._arret = threading.Event()
+
+    @property
+    def pret(self):
+        return self._etat is not None
+
+    @property
+    def version(self):
+        return self._etat[2] if self._etat is not None else None
+
+    @property
+    def nb_films(self):
+        return len(self._etat[0]) if self._etat is not None else 0
+
+    def charger(self):
+        if self.dossier_artefact:
+            version = version_actuelle(self.dossier_artefact)
+            recommandeur = Recommandeur.depuis_artefact(self.dossier_artefact, precision=self.precision)
+        else:
+            df, features, colonnes = charger_catalogue(self.source)
+            recommandeur = Recommandeur.depuis_catalogue(
+                df, features=features, precision=self.precision or "float64", colonnes=colonnes
+            )
+            version = None
+        self._etat = (recommandeur, BitmapsGenres(recommandeur.df), version)
+        self.erreur = None
+        mesurer_memoire(recommandeur)
+
+    def _surveiller(self):
+        try:
+            self.charger()
+        except Exception as e:
+            self.erreur = repr(e)
+            return
+        while self.dossier_artefact and not self._arret.wait(self.intervalle_verification):
+            try:
+                if version_actuelle(self.dossier_artefact) != self.version:
+                    self.charger()
+            except Exception as e:
+                self.erreur = repr(e)  # La version précédente reste servie
+
+    def demarrer(self):
+        threading.Thread(target=self._surveiller, name="chargement", daemon=True).start()
+
+    def arreter(self):
+        self._arret.set()
+        self.client_tmdb.fermer()
+
+    def _etat_courant(self):
+        etat = self._etat
+        if etat is None:
+            raise ServiceIndisponible(self.erreur or "Chargement en cours")
+        return etat
+
+    def _masque(self, bitmaps, genres):
+        if not genres:
+            return None
+        inconnus = [genre for genre in genres if genre not in bitmaps]
+        if inconnus:
+            raise RequeteInvalide(f"Genres inconnus : {', '.join(inconnus)}")
+        return bitmaps.masque(bitmaps.union(genres))
+
+    # Poids du reclassement et diversité vérifiés avant tout calcul (voir reclassement.reclasser)
+    def _reclassement(self, poids, diversite):
+        try:
+            poids = verifier_poids(poids) if poids is not None else None
+        except ValueError as e:
+            raise RequeteInvalide(str(e)) from None
+        if not 0 <= diversite < 1:
+            raise RequeteInvalide("Paramètre 'diversite' hors limites (0 à 1 exclu)")
+        return poids, diversite
+
+    def recommander(self, titre=None, film_id=None, n=5, genres=None, details=False, poids=None, diversite=0.0):
+        """Top-n d'un film désigné par son libellé ou son ID_film, avec détails TMDB optionnels.
+
+        `poids` (critère → poids) et `diversite` activent le reclassement hybride des candidats.
+        """
+        if titre is None and film_id is None:
+            raise RequeteInvalide("Paramètre 'titre' ou 'id' requis")
+        poids, diversite = self._reclassement(poids, diversite)
+        recommandeur, bitmaps, _ = self._etat_courant()
+        resultats = [
+            resultat_en_dict(resultat)
+            for resultat in recommandeur.recommander(
+                titre, n, film_id=film_id, masque=self._masque(bitmaps, genres), poids=poids, diversite=diversite
+            )
+        ]
+        if details:
+            lot = self.client_tmdb.details_lot([r["id_film"] for r in resultats], disponibles=True)
+            for resultat, (details_film, disponible) in zip(resultats, lot):
+                resultat["details"] = {**details_en_dict(details_film), "disponible": disponible}
+        return resultats
+
+    def recommander_lot(self, titres=None, ids=None, n=5, genres=None, poids=None, diversite=0.0):
+        """Top-n de plusieurs films ; sans filtre de genre ni reclassement, un seul produit matriciel pour tout le lot."""
+        poids, diversite = self._reclassement(poids, diversite)
+        recommandeur, bitmaps, _ = self._etat_courant()
+        requetes = [("titre", titre) for titre in titres or []] + [("id", film_id) for film_id in ids or []]
+        if len(requetes) > TAILLE_LOT_MAXIMUM:
+            raise RequeteInvalide(f"Au plus {TAILLE_LOT_MAXIMUM} films par lot")
+        masque = self._masque(bitmaps, genres)
+
+        reponses, connus = [], []
+        for cle, valeur in requetes:
+            try:
+                position = recommandeur.position(film_id=valeur) if cle == "id" else recommandeur.position(valeur)
+            except FilmInconnu:
+                reponses.append({cle: valeur, "erreur": "Film inconnu"})
+                continue
+            reponses.append({cle: valeur, "resultats": None})
+            connus.append((len(reponses) - 1, position))
+
+        if poids is not None or diversite:
+            signaux = recommandeur.signaux
+            listes = [
+                recommandeur.index_titres.resultats(
+                    reclasser(recommandeur.moteur, signaux, position, n, poids, diversite, masque=masque)
+                )
+                for _, position in connus
+            ]
+        elif connus and masque is None:
+            voisins, _ = recommandeur.voisins_bloc([position for _, position in connus], n)
+            listes = [recommandeur.index_titres.resultats(ligne) for ligne in voisins]
+        else:
+            listes = [
+                recommandeur.index_titres.resultats(recommandeur.moteur.top_n(position, n, masque=masque))
+                for _, position in connus
+            ]
+        for (rang, _), liste in zip(connus, listes):
+            reponses[rang]["resultats"] = [resultat_en_dict(resultat) for resultat in liste]
+        return reponses
+
+    def details(self, film_ids):
+        if len(film_ids) > TAILLE_LOT_MAXIMUM:
+            raise RequeteInvalide(f"Au plus {TAILLE_LOT_MAXIMUM} films par lot")
+        return [
+            {"id_film": film_id, **details_en_dict(details), "disponible": disponible}
+            for film_id, (details, disponible) in zip(film_ids, self.client_tmdb.details_lot(film_ids, disponibles=True))
+        ]
+
+
+def _entier(valeur, nom, minimum=1, maximum=N_MAXIMUM):
+    try:
+        valeur = int(valeur)
+    except (TypeError, ValueError):
+        raise RequeteInvalide(f"Paramètre '{nom}' invalide") from None
+    if not minimum <= valeur <= maximum:
+        raise RequeteInvalide(f"Paramètre '{nom}' hors limites ({minimum}-{maximum})")
+    return valeur
+
+
+def _liste(valeur):
+    if valeur is None:
+        return None
+    if isinstance(valeur, str):
+        return [element for element in valeur.split(",") if element]
+    return list(valeur)
+
+
+# Poids du reclassement : "popularite:0.3,note:0.1" en paramètre d'URL, objet en JSON
+def _poids(valeur):
+    if valeur is None or isinstance(valeur, dict):
+        return valeur
+    poids = {}
+    for element in _liste(valeur):
+        critere, _, nombre = element.partition(":")
+        try:
+            poids[critere] = float(nombre)
+        except ValueError:
+            raise RequeteInvalide(f"Poids invalide : {element}") from None
+    return poids
+
+
+def _reel(valeur, nom):
+    try:
+        return float(valeur)
+    except (TypeError, ValueError):
+        raise RequeteInvalide(f"Paramètre '{nom}' invalide") from None
+
+
+# Conversion des scalaires NumPy (identifiants, notes) lors de la sérialisation JSON
+def _json_defaut(objet):
+    if hasattr(objet, "item"):
+        return objet.item()
+    return str(objet)
+
+
+class GestionnaireRequetes(BaseHTTPRequestHandler):
+    """Routes JSON du service (le service du processus est porté par le serveur : `self.server.service`).
+
+    GET  /health                  processus vivant
+    GET  /ready                   catalogue chargé (503 sinon)
+    GET  /recommandations         ?titre=… ou ?id=…, &n=5, &genres=Comedie,Famille, &details=1,
+                                  &poids=popularite:0.3,recence:0.1, &diversite=0.3
+    POST /recommandations/lot     {"titres": […], "ids": […], "n": 5, "genres": […], "poids": {…}, "diversite": 0.3}
+    GET  /details                 ?ids=…,… (détails TMDB ; "disponible" faux si TMDB n'a pas pu les fournir)
+    GET  /metrics                 métriques du processus (format texte Prometheus)
+    """
+
+    protocol_version = "HTTP/1.1"
+    # En-têtes et corps partent en deux écritures : sans TCP_NODELAY, Nagle retient la seconde
+    # jusqu'à l'ACK retardé du client (~40 ms par réponse en keep-alive)
+    disable_nagle_algorithm = True
+    server_version = "Decodex"
+
+    def _repondre(self, statut, corps):
+        contenu = json.dumps(corps, ensure_ascii=False, default=_json_defaut).encode("utf-8")
+        self.send_response(statut)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(contenu)))
+        self.end_headers()
+        self.wfile.write(contenu)
+
+    def _traiter(self, route, nom=None):
+        try:
+            if nom is None:
+                statut, corps = route()
+            else:
+                # Requête métier : trace (durée par étape) et profil cProfile si DECODEX_PROFIL est défini
+                with trace(nom):
+                    statut, corps = route()
+        except RequeteInvalide as e:
+            statut, corps = 400, {"erreur": str(e)}
+        except FilmInconnu as e:
+            statut, corps = 404, {"erreur": f"Film inconnu : {e.args[0]}"}
+        except ServiceIndisponible as e:
+            statut, corps = 503, {"erreur": str(e)}
+        except Exception as e:
+            statut, corps = 500, {"erreur": repr(e)}
+        if nom is not None:
+            compter("decodex_requetes_http_total", route=nom, statut=statut)
+        self._repondre(statut, corps)
+
+    def do_GET(self):
+        adresse = urlsplit(self.path)
+        parametres = {cle: valeurs[-1] for cle, valeurs in parse_qs(adresse.query).items()}
+        if adresse.path == "/metrics":
+            self._metriques()
+            return
+        routes = {
+            "/health": self._sante,
+            "/ready": self._pret,
+        }
+        routes_metier = {
+            "/recommandations": lambda: self._recommandations(parametres),
+            "/details": lambda: self._details(parametres),
+        }
+        if adresse.path in routes_metier:
+            self._traiter(routes_metier[adresse.path], adresse.path)
+        else:
+            self._traiter(routes.get(adresse.path, self._introuvable))
+
+    def do_POST(self):
+        adresse = urlsplit(self.path)
+        if adresse.path != "/recommandations/lot":
+            self._traiter(self._introuvable)
+            return
+        longueur = int(self.headers.get("Content-Length", 0))
+        self._traiter(lambda: self._lot(self.rfile.read(longueur)), adresse.path)
+
+    # Compteurs, jauges et histogrammes du processus au format texte Prometheus
+    def _metriques(self):
+        contenu = registre.exporter_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(contenu)))
+        self.end_headers()
+        self.wfile.write(contenu)
+
+    def _introuvable(self):
+        return 404, {"erreur": f"Route inconnue : {self.path}"}
+
+    def _sante(self):
+        return 200, {"statut": "ok", "pid": os.getpid()}
+
+    def _pret(self):
+        service = self.server.service
+        if not service.pret:
+            return 503, {"statut": "chargement", "erreur": service.erreur}
+        return 200, {"statut": "pret", "version": service.version, "films": service.nb_films, "pid": os.getpid()}
+
+    def _recommandations(self, parametres):
+        resultats = self.server.service.recommander(
+            titre=parametres.get("titre"),
+            film_id=parametres.get("id"),
+            n=_entier(parametres.get("n", 5), "n"),
+            genres=_liste(parametres.get("genres")),
+            details=parametres.get("details", "0") not in ("0", "false", ""),
+            poids=_poids(parametres.get("poids")),
+            diversite=_reel(parametres.get("diversite", 0), "diversite"),
+        )
+        return 200, {"resultats": resultats}
+
+    def _lot(self, contenu):
+        try:
+            corps = json.loads(contenu or b"{}")
+        except json.JSONDecodeError:
+            raise RequeteInvalide("Corps JSON invalide") from None
+        if not isinstance(corps, dict):
+            raise RequeteInvalide("Le corps JSON doit être un objet")
+        reponses = self.server.service.recommander_lot(
+            titres=_liste(corps.get("titres")),
+            ids=_liste(corps.get("ids")),
+            n=_entier(corps.get("n", 5), "n"),
+            genres=_liste(corps.get("genres")),
+            poids=_poids(corps.get("poids")),
+            diversite=_reel(corps.get("diversite", 0), "diversite"),
+        )
+        return 200, {"reponses": reponses}
+
+    def _details(self, parametres):
+        film_ids = _liste(parametres.get("ids"))
+        if not film_ids:
+            raise RequeteInvalide("Paramètre 'ids' requis")
+        return 200, {"details": self.server.service.details(film_ids)}
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"[{os.getpid()}] {self.address_string()} - {format % args}\n")
+
+
+def servir(hote="127.0.0.1", port=8000, nb_processus=1, **options):
+    """Démarre le service sur (hote, port) avec `nb_processus` processus partageant le même socket.
+
+    Le socket est ouvert une fois puis les processus sont créés par fork : chacun
+    charge son propre recommandeur (pages mmap de l'artefact partagées) et accepte
+    les connexions en parallèle des autres. `options` est passé à ServiceRecommandation.
+    """
+    serveur = ThreadingHTTPServer((hote, port), GestionnaireRequetes)
+    serveur.daemon_threads = True
+
+    def executer():
+        serveur.service = ServiceRecommandation(**options)
+        serveur.service.demarrer()
+        try:
+            serveur.serve_forever()
+        finally:
+            serveur.service.arreter()
+
+    if nb_processus <= 1:
+        executer()
+        return
+
+    enfants = []
+    for _ in range(nb_processus):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                executer()
+            finally:
+                os._exit(0)
+        enfants.append(pid)
+
+    def arreter(signum, frame):
+        for pid in enfants:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, arreter)
+    signal.signal(signal.SIGINT, arreter)
+    for pid in enfants:
+        os.waitpid(pid, 0)
+    serveur.server_close()
+
+
+class ClientService:
+    """Client du service HTTP, avec la même interface que Recommandeur.recommander / ClientTMDB.details_*."""
+
+    def __init__(self, url, timeout=(3.05, 30)):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _get(self, route, **parametres):
+        response = self.session.get(f"{self.url}{route}", params=parametres, timeout=self.timeout)
+        if response.status_code == 404 and route == "/recommandations":
+            raise FilmInconnu(parametres.get("titre", parametres.get("id")))
+        response.raise_for_status()
+        return response.json()
+
+    # (titre, lien de l'affiche, ID_film) des n films les plus similaires
+    def recommander(self, titre=None, n=5, film_id=None, genres=None, poids=None, diversite=0.0):
+        parametres = {"n": n}
+        if film_id is not None:
+            parametres["id"] = film_id
+        else:
+            parametres["titre"] = titre
+        if genres:
+            parametres["genres"] = ",".join(genres)
+        if poids is not None:
+            parametres["poids"] = ",".join(f"{critere}:{valeur}" for critere, valeur in poids.items())
+        if diversite:
+            parametres["diversite"] = diversite
+        resultats = self._get("/recommandations", **parametres)["resultats"]
+        return [(r["titre"], r["lien"], r["id_film"]) for r in resultats]
+
+    def details_lot(self, film_ids, disponibles=False):
+        if not film_ids:
+            return []
+        reponse = self._get("/details", ids=",".join(str(film_id) for film_id in film_ids))
+        resultats = [
+            (tuple(details[champ] for champ in CHAMPS_DETAILS), details.get("disponible", True))
+            for details in reponse["details"]
+        ]
+        return resultats if disponibles else [details for details, _ in resultats]
+
+    def details(self, film_id):
+        return self.details_lot([film_id])[0]
+
+    # Même forme que ClientTMDB.details_au_fil (une seule requête : tout arrive en même temps)
+    def details_au_fil(self, film_ids):
+        for position, (details, disponible) in enumerate(self.details_lot(film_ids, disponibles=True)):
+            yield position, details, disponible
+
+    def fermer(self):
+        self.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service HTTP JSON de recommandation de films.")
+    parser.add_argument("--artefact", default=os.getenv("DECODEX_ARTEFACT"), help="Dossier d'artefact (voir artefact.py)")
+    parser.add_argument("--source", default=os.getenv("DECODEX_SOURCE", download_url), help="TSV utilisé sans artefact")
+    parser.add_argument("--precision", default=os.getenv("PRECISION"), help="Précision des vecteurs (voir stockage.py)")
+    parser.add_argument("--hote", default="127.0.0.1", help="Adresse d'écoute")
+    parser.add_argument("--port", type=int, default=8000, help="Port d'écoute")
+    parser.add_argument("--processus", type=int, default=1, help="Nombre de processus (artefact partagé en mmap)")
+    parser.add_argument("--verification", type=float, default=30, help="Intervalle de détection d'une nouvelle version, en s")
+    args = parser.parse_args()
+
+    print(f"Service sur http://{args.hote}:{args.port} ({args.processus} processus)", file=sys.stderr)
+    servir(
+        args.hote, args.port, args.processus,
+        dossier_artefact=args.artefact, source=args.source, precision=args.precision,
+        api_key=os.getenv("TMDB_API_KEY"), intervalle_verification=args.verification,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import numpy as np
+import scipy.sparse as sp
+
+from metriques import compter
+
+
+# Normalisation L2 ligne par ligne : le produit scalaire de deux lignes normalisées
+# est exactement leur similarité cosinus (les lignes nulles restent nulles, comme
+# avec sklearn.metrics.pairwise.cosine_similarity). Les matrices creuses restent creuses.
+def normaliser_l2(matrice):
+    if sp.issparse(matrice):
+        matrice = sp.csr_matrix(matrice, dtype=np.float64)
+        normes = np.sqrt(np.asarray(matrice.multiply(matrice).sum(axis=1)).ravel())
+        normes[normes == 0] = 1.0
+        return (sp.diags(1.0 / normes) @ matrice).tocsr()
+    matrice = np.asarray(matrice, dtype=np.float64)
+    if matrice.ndim == 1:
+        matrice = matrice.reshape(1, -1)
+    normes = np.linalg.norm(matrice, axis=1, keepdims=True)
+    normes[normes == 0] = 1.0
+    return matrice / normes
+
+
+# Produits scalaires A @ B.T en tableau dense, que A et B soient creuses ou non
+def produits_scalaires(a, b):
+    produit = a @ b.T
+    return produit.toarray() if sp.issparse(produit) else np.asarray(produit)
+
+
+# Sélection des n meilleurs scores par ligne, sans tri complet
+def selectionner_top_n(scores, n, exclure=None, masque=None):
+    """Retourne les indices des n plus grands scores, triés par score décroissant.
+
+    `scores` peut être un vecteur (une requête) ou une matrice (une ligne par requête).
+    `exclure` donne, pour chaque ligne, l'indice à écarter (le film lui-même).
+    `masque` (booléens, un par colonne) restreint la sélection aux colonnes retenues ;
+    il est appliqué avant la sélection, pour le même coût qu'une requête non filtrée.
+    Parmi les candidats retenus, à score égal, l'indice le plus petit passe en premier.
+    """
+    une_ligne = scores.ndim == 1
+    scores = np.array(scores, dtype=np.float64, ndmin=2)  # copie : on modifie les scores exclus
+    nb_lignes, nb_colonnes = scores.shape
+
+    if masque is not None:
+        scores[:, ~masque] = -np.inf
+        nb_colonnes = int(np.count_nonzero(masque))
+    if exclure is not None:
+        exclure = np.atleast_1d(exclure)
+        scores[np.arange(nb_lignes), exclure] = -np.inf
+        if masque is None or masque[exclure].any():
+            nb_colonnes -= 1
+
+    n = max(0, min(n, nb_colonnes))
+    if n == 0:
+        vide = np.empty((nb_lignes, 0), dtype=np.intp)
+        return vide[0] if une_ligne else vide
+
+    # argpartition isole les n meilleurs en O(N), seul ce sous-ensemble est trié
+    if n < scores.shape[1]:
+        candidats = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    else:
+        candidats = np.tile(np.arange(scores.shape[1]), (nb_lignes, 1))
+    scores_candidats = np.take_along_axis(scores, candidats, axis=1)
+    ordre = np.lexsort((candidats, -scores_candidats), axis=1)
+    resultat = np.take_along_axis(candidats, ordre, axis=1)
+    if une_ligne:
+        resultat = resultat[0]
+        # Une seule requête : on écarte les films hors masque si le masque en retient trop peu
+        return resultat[np.isfinite(scores[0, resultat])] if masque is not None else resultat
+    return resultat
+
+
+# Vrai si le tableau (ou celui dont il est une vue) est ouvert en mmap
+def est_mappe(tableau):
+    while tableau is not None:
+        if isinstance(tableau, np.memmap):
+            return True
+        tableau = getattr(tableau, "base", None)
+    return False
+
+
+class MoteurSimilarite:
+    """Moteur de similarité cosinus calculée à la demande.
+
+    Seuls les vecteurs normalisés sont conservés : chaque requête calcule une ligne
+    de scores (N flottants) au lieu de garder la matrice N×N en mémoire.
+    Avec `k_voisins`, les K plus proches voisins de chaque film sont précalculés ;
+    `conserver_vecteurs=False` libère alors les vecteurs et ne garde que cette table.
+    `construire_index_approx` branche un index approché (IVF) derrière `top_n`.
+    `precision` ("float64", "float32", "float16" ou "int8") règle le stockage des vecteurs :
+    en float16/int8, le premier tri se fait sur une copie compacte (voir stockage.py)
+    et les `facteur_reclassement` × n meilleurs candidats sont reclassés exactement ;
+    ces précisions nécessitent les noms des colonnes des features (`colonnes`).
+    """
+
+    def __init__(self, features, k_voisins=None, conserver_vecteurs=True, taille_bloc=1024,
+                 precision="float64", facteur_reclassement=4, colonnes=None):
+        self.vecteurs = normaliser_l2(features)
+        self.nb_films = self.vecteurs.shape[0]
+        self.voisins = None
+        self.scores_voisins = None
+        self.index_approx = None
+        self.colonnes = colonnes
+        self.configurer_precision(precision, facteur_reclassement)
+        if k_voisins:
+            self.precalculer_voisins(k_voisins, taille_bloc=taille_bloc)
+            if not conserver_vecteurs:
+                self.vecteurs = None
+
+    # Moteur construit sur des vecteurs déjà normalisés (par exemple ouverts en mmap depuis un artefact)
+    @classmethod
+    def depuis_vecteurs(cls, vecteurs, voisins=None, scores_voisins=None, colonnes=None):
+        moteur = cls.__new__(cls)
+        moteur.vecteurs = vecteurs
+        moteur.colonnes = colonnes
+        moteur.nb_films = vecteurs.shape[0] if vecteurs is not None else voisins.shape[0]
+        moteur.voisins = voisins
+        moteur.scores_voisins = scores_voisins
+        moteur.index_approx = None
+        moteur.precision = str(vecteurs.dtype) if vecteurs is not None else None
+        moteur.stockage = None
+        moteur.facteur_reclassement = 4
+        return moteur
+
+    # Choix de la précision : float32 remplace les vecteurs exacts, float16/int8 ajoutent
+    # une copie compacte pour le premier tri (les vecteurs exacts, éventuellement en mmap,
+    # ne sont alors lus que pour les candidats à reclasser)
+    def configurer_precision(self, precision, facteur_reclassement=4):
+        from stockage import PRECISIONS, PRECISIONS_COMPACTES, StockageVecteurs
+
+        if precision not in PRECISIONS:
+            raise ValueError(f"Précision inconnue : {precision}")
+        if precision in PRECISIONS_COMPACTES and self.vecteurs is not None and self.colonnes is None:
+            raise ValueError(f"La précision {precision} nécessite les noms des colonnes des features")
+        self.precision = precision
+        self.facteur_reclassement = facteur_reclassement
+        self.stockage = None
+        if precision == "float64" or self.vecteurs is None:
+            return
+        # Des vecteurs ouverts en mmap restent sur disque : les convertir en ferait une copie en mémoire
+        valeurs = self.vecteurs.data if sp.issparse(self.vecteurs) else self.vecteurs
+        if self.vecteurs.dtype != np.float32 and not est_mappe(valeurs):
+            self.vecteurs = self.vecteurs.astype(np.float32)
+        if precision in PRECISIONS_COMPACTES:
+            self.stockage = StockageVecteurs(self.vecteurs, self.colonnes, precision)
+
+    # Mémoire occupée par les vecteurs utilisés pour le premier tri (octets)
+    def memoire_vecteurs(self):
+        if self.stockage is not None:
+            return self.stockage.nbytes
+        if self.vecteurs is None:
+            return 0
+        if sp.issparse(self.vecteurs):
+            return self.vecteurs.data.nbytes + self.vecteurs.indices.nbytes + self.vecteurs.indptr.nbytes
+        return self.vecteurs.nbytes
+
+    # Mémoire (octets) des vecteurs, de la table des voisins et de l'index approché
+    def memoire(self):
+        memoire = {"vecteurs": self.memoire_vecteurs()}
+        if self.voisins is not None:
+            memoire["voisins"] = self.voisins.nbytes + self.scores_voisins.nbytes
+        if self.index_approx is not None:
+            memoire["index_approx"] = self.index_approx.nbytes
+        return memoire
+
+    def __len__(self):
+        return self.nb_films
+
+    # Similarités d'un film (vecteur) ou d'un lot de films (matrice) avec tout le catalogue
+    def scores(self, indices):
+        if self.vecteurs is None:
+            raise ValueError("Vecteurs non conservés : seuls les voisins précalculés sont disponibles")
+        une_ligne = np.ndim(indices) == 0
+        scores = produits_scalaires(self.vecteurs[np.atleast_1d(indices)], self.vecteurs)
+        return scores[0] if une_ligne else scores
+
+    # Indices des n films les plus similaires (le film lui-même est exclu),
+    # éventuellement restreints aux films retenus par `masque` (par exemple un genre)
+    def top_n(self, index, n, masque=None):
+        if self.voisins is not None:
+            voisins = self.voisins[index]
+            if masque is not None:
+                voisins = voisins[masque[voisins]]
+            # La table précalculée suffit si elle contient assez de voisins retenus
+            if len(voisins) >= n or self.vecteurs is None:
+                compter("decodex_similarite_requetes_total", chemin="voisins")
+                return voisins[:n]
+        if self.index_approx is not None:
+            compter("decodex_similarite_requetes_total", chemin="index_approx")
+            return self.index_approx.top_n(index, n, masque=masque)
+        if self.stockage is not None:
+            compter("decodex_similarite_requetes_total", chemin="reclassement")
+            return self._top_n_reclasse(np.atleast_1d(index), n, masque)[0]
+        compter("decodex_similarite_requetes_total", chemin="exact")
+        return selectionner_top_n(self.scores(index), n, exclure=index, masque=masque)
+
+    # Candidats d'un reclassement : les `nb` films les plus similaires et leur similarité cosinus exacte
+    def candidats(self, index, nb, masque=None):
+        if self.vecteurs is None:
+            voisins, scores = self.voisins[index], self.scores_voisins[index]
+            if masque is not None:
+                retenus = masque[voisins]
+                voisins, scores = voisins[retenus], scores[retenus]
+            return np.asarray(voisins[:nb]), np.asarray(scores[:nb], dtype=np.float64)
+        indices = np.asarray(self.top_n(index, nb, masque=masque))
+        return indices, produits_scalaires(self.vecteurs[[index]], self.vecteurs[indices])[0]
+
+    # Premier tri sur le stockage compact, puis reclassement exact des meilleurs candidats
+    def _top_n_reclasse(self, indices, n, masque=None):
+        requetes = self.vecteurs[indices]
+        approches = self.stockage.produits(requetes)
+        candidats = selectionner_top_n(approches, n * self.facteur_reclassement, exclure=indices, masque=masque)
+        resultats = []
+        for ligne, candidats_ligne in enumerate(candidats):
+            if masque is not None:
+                candidats_ligne = candidats_ligne[masque[candidats_ligne]]
+            exacts = produits_scalaires(requetes[ligne:ligne + 1], self.vecteurs[candidats_ligne])[0]
+            resultats.append(candidats_ligne[selectionner_top_n(exacts, n)])
+        return resultats
+
+    # Index approché pour les très grands catalogues (voir index_approx.IndexIVF)
+    def construire_index_approx(self, **options):
+        from index_approx import IndexIVF
+
+        if self.vecteurs is None:
+            raise ValueError("Vecteurs non conservés : impossible de construire l'index approché")
+        self.index_approx = IndexIVF(self.vecteurs, **options)
+        return self.index_approx
+
+    # Précalcul de la table des K plus proches voisins, bloc de lignes par bloc de lignes
+    # pour ne jamais matérialiser plus de `taille_bloc` × N scores à la fois
+    def precalculer_voisins(self, k, taille_bloc=1024):
+        k = min(k, self.nb_films - 1)
+        voisins = np.empty((self.nb_films, k), dtype=np.int32)
+        scores_voisins = np.empty((self.nb_films, k), dtype=np.float32)
+        for debut in range(0, self.nb_films, taille_bloc):
+            indices = np.arange(debut, min(debut + taille_bloc, self.nb_films))
+            scores = self.scores(indices)
+            top = selectionner_top_n(scores, k, exclure=indices)
+            voisins[indices] = top
+            scores_voisins[indices] = np.take_along_axis(scores, top, axis=1)
+        self.voisins = voisins
+        self.scores_voisins = scores_voisins
+        return voisins
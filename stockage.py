@@ -0,0 +1,156 @@
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from caracteristiques import PREFIXES_ONE_HOT, poids_colonne
+
+# Précisions disponibles pour les vecteurs de features
+PRECISIONS = ("float64", "float32", "float16", "int8")
+
+# Précisions qui ajoutent une copie compacte (StockageVecteurs) pour le premier tri
+PRECISIONS_COMPACTES = ("float16", "int8")
+
+
+class StockageVecteurs:
+    """Copie compacte des vecteurs normalisés utilisée pour le premier tri des candidats.
+
+    Les cosinus du catalogue sont presque tous proches de 1 et ne se départagent qu'à
+    ~1e-5 près, sur les colonnes générales (note, votants, année…) : ces colonnes,
+    peu nombreuses, restent exactes en float32 dans un tableau dense.
+    Seules les colonnes DIR_/ACT_ (l'essentiel des valeurs stockées) sont compressées
+    en float16 ou int8. Leur valeur normalisée vaut poids de la colonne × indicatrice
+    / norme du film : divisée par l'échelle de la dimension (son poids dans `poids`) puis
+    par une échelle par film (le maximum de la ligne), elle devient un code entre -1 et 1
+    (1 pour une indicatrice), que float16 comme int8 représentent sans perte.
+    `colonnes` donne les noms des colonnes des vecteurs (voir caracteristiques.construire_features).
+    Le calcul se fait par blocs de lignes convertis en float32 à la volée, ce qui borne
+    la mémoire de travail ; seul le stockage reste compact.
+    """
+
+    def __init__(self, vecteurs, colonnes, precision="float16", taille_bloc=65_536):
+        if precision not in PRECISIONS_COMPACTES:
+            raise ValueError(f"Précision inconnue : {precision}")
+        if len(colonnes) != vecteurs.shape[1]:
+            raise ValueError("Il faut un nom de colonne par dimension des vecteurs")
+        self.precision = precision
+        self.taille_bloc = taille_bloc
+        self.forme = vecteurs.shape
+        vecteurs = sp.csr_matrix(vecteurs)
+
+        # Colonnes générales, exactes en float32
+        compressees = np.array([str(col).startswith(PREFIXES_ONE_HOT) for col in colonnes])
+        self.colonnes_exactes = np.flatnonzero(~compressees)
+        self.exactes = np.asarray(vecteurs[:, self.colonnes_exactes].toarray(), dtype=np.float32)
+
+        # Colonnes DIR_/ACT_ : codes par rapport aux échelles de dimension (poids) et de ligne
+        self.echelles = np.array([poids_colonne(str(col)) for col in colonnes], dtype=np.float32)
+        self.echelles[~compressees] = 0.0  # déjà comptées dans la partie exacte
+        gardees = compressees[vecteurs.indices]
+        lignes = np.repeat(np.arange(self.forme[0]), np.diff(vecteurs.indptr))[gardees]
+        self.indices = vecteurs.indices[gardees].astype(np.int32)
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(lignes, minlength=self.forme[0]))))
+        rapports = vecteurs.data[gardees] / self.echelles[self.indices]
+        maximums = np.zeros(self.forme[0])
+        np.maximum.at(maximums, lignes, np.abs(rapports))
+        self.echelles_lignes = np.where(maximums > 0, maximums, 1.0).astype(np.float32)
+        codes = rapports / self.echelles_lignes[lignes]
+        if precision == "int8":
+            self.valeurs = np.rint(codes * 127).astype(np.int8)
+            self.echelles_lignes /= 127
+        else:
+            self.valeurs = codes.astype(np.float16)
+
+    @property
+    def nbytes(self):
+        return (
+            self.exactes.nbytes + self.valeurs.nbytes + self.indices.nbytes + self.indptr.nbytes
+            + self.echelles.nbytes + self.echelles_lignes.nbytes
+        )
+
+    def __len__(self):
+        return self.forme[0]
+
+    # Bloc de lignes de la partie compressée, décompressé en float32 (codes seuls, sans les échelles)
+    def _bloc(self, debut, fin):
+        a, b = self.indptr[debut], self.indptr[fin]
+        return sp.csr_matrix(
+            (self.valeurs[a:b].astype(np.float32), self.indices[a:b], self.indptr[debut:fin + 1] - a),
+            shape=(fin - debut, self.forme[1]),
+        )
+
+    def produits(self, requetes):
+        """Similarités approchées (float32) entre des vecteurs requêtes exacts (matrice m×D) et tout le stockage."""
+        if sp.issparse(requetes):
+            requetes = requetes.toarray()
+        requetes = np.asarray(requetes, dtype=np.float32)
+        exactes = np.ascontiguousarray(requetes[:, self.colonnes_exactes].T)
+        # Σ_j r_j · e_i · s_j · c_ij = e_i · Σ_j (r_j · s_j) · c_ij : l'échelle de dimension passe
+        # du côté de la requête, l'échelle de ligne s'applique au score du film
+        compressees = np.ascontiguousarray((requetes * self.echelles).T)
+        scores = np.empty((requetes.shape[0], self.forme[0]), dtype=np.float32)
+        for debut in range(0, self.forme[0], self.taille_bloc):
+            fin = min(debut + self.taille_bloc, self.forme[0])
+            partiels = (self._bloc(debut, fin) @ compressees) * self.echelles_lignes[debut:fin, None]
+            scores[:, debut:fin] = (self.exactes[debut:fin] @ exactes + partiels).T
+        return scores
+
+
+def comparer_precisions(features, colonnes, n=10, taille_echantillon=200, precisions=PRECISIONS,
+                        facteur_reclassement=4, graine=0):
+    """Compare les recommandations obtenues à chaque précision avec la référence float64.
+
+    Pour chaque précision : mémoire des vecteurs, part des listes top-n strictement
+    identiques, recouvrement moyen avec la référence et latence médiane par requête.
+    """
+    from similarite import MoteurSimilarite
+
+    reference = MoteurSimilarite(features)
+    rng = np.random.default_rng(graine)
+    requetes = rng.choice(len(reference), min(taille_echantillon, len(reference)), replace=False)
+    attendus = {i: reference.top_n(i, n) for i in requetes}
+
+    rapport = []
+    for precision in precisions:
+        moteur = MoteurSimilarite(
+            features, precision=precision, facteur_reclassement=facteur_reclassement, colonnes=colonnes
+        )
+        identiques, recouvrements, latences = 0, [], []
+        for i in requetes:
+            debut = time.perf_counter()
+            obtenus = moteur.top_n(i, n)
+            latences.append(time.perf_counter() - debut)
+            identiques += np.array_equal(obtenus, attendus[i])
+            recouvrements.append(len(np.intersect1d(obtenus, attendus[i])) / max(len(attendus[i]), 1))
+        rapport.append({
+            "precision": precision,
+            "memoire_mo": moteur.memoire_vecteurs() / 2**20,
+            "listes_identiques": identiques / len(requetes),
+            "recouvrement": float(np.mean(recouvrements)),
+            "latence_ms": 1000 * float(np.median(latences)),
+        })
+    return rapport
+
+
+def main():
+    from donnees import charger_catalogue, download_url
+
+    parser = argparse.ArgumentParser(description="Compare les classements obtenus selon la précision des vecteurs.")
+    parser.add_argument("--source", default=download_url, help="URL ou chemin local du TSV du catalogue")
+    parser.add_argument("-n", type=int, default=10, help="Nombre de films similaires comparés")
+    parser.add_argument("--echantillon", type=int, default=200, help="Nombre de films requêtes tirés au hasard")
+    parser.add_argument("--reclassement", type=int, default=4, help="Candidats reclassés en float32 (multiple de n)")
+    args = parser.parse_args()
+
+    _, features, colonnes = charger_catalogue(args.source)
+    print(f"{'précision':<10} {'mémoire (Mo)':>13} {'identiques':>11} {'recouvrement':>13} {'latence (ms)':>13}")
+    for ligne in comparer_precisions(features, colonnes, args.n, args.echantillon, facteur_reclassement=args.reclassement):
+        print(
+            f"{ligne['precision']:<10} {ligne['memoire_mo']:>13.1f} {ligne['listes_identiques']:>11.1%}"
+            f" {ligne['recouvrement']:>13.1%} {ligne['latence_ms']:>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
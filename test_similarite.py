@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+
+from benchmark import morceaux_synthetiques
+from caracteristiques import construire_features, poids
+from donnees import assembler_catalogue
+from mise_a_jour import lignes_concernees, mettre_a_jour_voisins, verifier_voisins
+from recommandation import Recommandeur
+from reclassement import reclasser
+from similarite import MoteurSimilarite, normaliser_l2
+from stockage import comparer_precisions
+
+NB_FILMS = 1500
+N = 10
+K = 20
+
+
+@pytest.fixture(scope="module")
+def catalogue():
+    return pd.concat(morceaux_synthetiques(NB_FILMS, nb_realisateurs=100, nb_acteurs=300), ignore_index=True)
+
+
+# Classement de la version d'origine de l'application : colonnes pondérées une à une,
+# matrice cosinus dense complète, puis argsort de la ligne du film
+def classement_origine(df, indices, n):
+    cosine_similarity = pytest.importorskip("sklearn.metrics.pairwise").cosine_similarity
+    df = df.copy()
+    for col in df.columns:
+        if col in poids:
+            df[col] = df[col] * poids[col]
+        elif col.startswith("DIR_"):
+            df[col] = df[col] * poids["DIR_"]
+        elif col.startswith("ACT_"):
+            df[col] = df[col] * poids["ACT_"]
+    cos_sim = cosine_similarity(df.select_dtypes(include=[np.number]))
+    return cos_sim, {i: np.argsort(cos_sim[i])[-n - 1:-1][::-1] for i in indices}
+
+
+@pytest.mark.parametrize("k_voisins", [None, K])
+def test_top_n_identique_au_classement_origine(catalogue, k_voisins):
+    features, _ = construire_features(catalogue, poids)
+    moteur = MoteurSimilarite(features, k_voisins=k_voisins)
+    indices = range(0, NB_FILMS, 7)
+    cos_sim, attendus = classement_origine(catalogue, indices, N)
+    for i in indices:
+        obtenus = moteur.top_n(i, N)
+        np.testing.assert_allclose(cos_sim[i, obtenus], cos_sim[i, attendus[i]], rtol=0, atol=1e-12)
+        np.testing.assert_array_equal(obtenus, attendus[i])
+
+
+def test_precisions_compactes_aussi_fiables_que_float32(catalogue):
+    features, colonnes = construire_features(catalogue, poids)
+    rapport = {ligne["precision"]: ligne for ligne in comparer_precisions(features, colonnes, N, taille_echantillon=100)}
+    for precision in ("float16", "int8"):
+        assert rapport[precision]["recouvrement"] >= rapport["float32"]["recouvrement"] - 0.01
+        assert rapport[precision]["memoire_mo"] < rapport["float32"]["memoire_mo"]
+
+
+def test_diversite_croissante_modifie_les_recommandations(catalogue):
+    df, features, colonnes = assembler_catalogue([catalogue])
+    recommandeur = Recommandeur.depuis_catalogue(df, k_voisins=K, features=features, colonnes=colonnes)
+    index = 0
+    base = reclasser(recommandeur.moteur, recommandeur.signaux, index, N)
+    nouveaux = [
+        len(set(reclasser(recommandeur.moteur, recommandeur.signaux, index, N, diversite=diversite)) - set(base))
+        for diversite in (0.3, 0.6, 0.9)
+    ]
+    assert nouveaux == sorted(nouveaux) and nouveaux[-1] > nouveaux[0]
+
+
+@pytest.fixture(scope="module")
+def mise_a_jour(catalogue):
+    # Ancien catalogue, puis 40 films remplacés et 60 films ajoutés (tirés d'un autre catalogue)
+    features, _ = construire_features(catalogue, poids)
+    anciens = normaliser_l2(features)
+    ancien_moteur = MoteurSimilarite.depuis_vecteurs(anciens)
+    ancien_moteur.precalculer_voisins(K)
+
+    autres = pd.concat(morceaux_synthetiques(100, nb_realisateurs=100, nb_acteurs=300, graine=1), ignore_index=True)
+    delta = normaliser_l2(construire_features(autres, poids)[0])
+    remplaces = np.arange(0, NB_FILMS, NB_FILMS // 40)[:40]
+    lignes = sp.vstack([anciens, delta[40:]], format="lil")
+    lignes[remplaces] = delta[:40]
+    vecteurs = sp.csr_matrix(lignes)
+    modifies = np.concatenate([remplaces, NB_FILMS + np.arange(60)])
+
+    voisins, scores, _ = mettre_a_jour_voisins(
+        vecteurs, ancien_moteur.voisins.copy(), ancien_moteur.scores_voisins.copy(), modifies, taille_bloc=64
+    )
+    return vecteurs, voisins, scores, modifies
+
+
+def test_mise_a_jour_identique_au_recalcul_complet(mise_a_jour):
+    vecteurs, voisins, scores, _ = mise_a_jour
+    reference = MoteurSimilarite(vecteurs, k_voisins=K)
+    # Même scores partout ; les voisins ne peuvent différer qu'entre films à score égal
+    np.testing.assert_allclose(scores, reference.scores_voisins, rtol=0, atol=1e-6)
+    assert np.mean(voisins == reference.voisins) > 0.99
+    assert len(verifier_voisins(vecteurs, voisins, scores, np.arange(vecteurs.shape[0]))) == 0
+
+
+def test_verifier_voisins_signale_les_ecarts(mise_a_jour):
+    vecteurs, voisins, scores, modifies = mise_a_jour
+    voisins = voisins.copy()
+    voisins[5, 0] = voisins[5, 1]  # doublon
+    voisins[7, -1] = (voisins[7, -1] + 1) % len(voisins)  # voisin qui n'est pas dans le top-K
+    lignes = lignes_concernees(vecteurs, voisins, scores, modifies)
+    assert set(verifier_voisins(vecteurs, voisins, scores, np.union1d(lignes, [5, 7]))) == {5, 7}
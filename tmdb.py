@@ -0,0 +1,207 @@
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache_tmdb import ABSENT, PERIME
+from metriques import compter, etape
+
+# URL de base de l'API TMDB (surchargeable pour pointer vers un serveur local de test)
+URL_API_TMDB = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+
+
+# Film absent de TMDB (404) ou identifiant manquant dans le catalogue
+class FilmIntrouvable(ValueError):
+    pass
+
+
+def identifiant_manquant(film_id):
+    return film_id is None or (isinstance(film_id, float) and math.isnan(film_id)) or str(film_id).strip() == ""
+
+
+# Détails renvoyés en cas d'erreur (même forme que les détails d'un film)
+def details_par_defaut(message):
+    return (
+        "N/A",                  # duree
+        [],                     # genres
+        f"Erreur : {message}",  # synopsis
+        "N/A",                  # date_sortie
+        [],                     # acteurs
+        None,                   # video_url
+        "Inconnu",              # directeur
+        0.0,                    # note
+        0,                      # budget
+        0                       # revenu
+    )
+
+
+# Fonction pour formater la date au format "JJ/MM/AAAA"
+def formater_date(date_str):
+    try:
+        # Convertir la chaîne de date en objet datetime
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+        # Formater la date en "JJ/MM/AAAA"
+        return date_obj.strftime("%d/%m/%Y")  # Format : 06/02/2019
+    except (TypeError, ValueError):
+        return date_str  # Retourner la date telle quelle si la conversion échoue
+
+
+# Extraction des détails affichés à partir d'une réponse /movie/{id}?append_to_response=credits,videos
+def extraire_details(data, nb_acteurs=5):
+    duree = data.get("runtime", "N/A")
+    genres = [genre["name"] for genre in data.get("genres", [])]
+    synopsis = data.get("overview", "Aucun synopsis disponible.")
+    date_sortie_formatee = formater_date(data.get("release_date", "N/A"))
+
+    credits = data.get("credits", {})
+    acteurs = [acteur["name"] for acteur in credits.get("cast", [])][:nb_acteurs]  # Acteurs principaux
+    directeur = next((m["name"] for m in credits.get("crew", []) if m.get("job") == "Director"), "Inconnu")
+
+    # Utilisation de la première vidéo disponible
+    videos = data.get("videos", {}).get("results", [])
+    video_url = f"https://www.youtube.com/watch?v={videos[0]['key']}" if videos else None
+
+    note = data.get("vote_average", 0.0)
+    budget = data.get("budget", 0)
+    revenu = data.get("revenue", 0)
+
+    return duree, genres, synopsis, date_sortie_formatee, acteurs, video_url, directeur, note, budget, revenu
+
+
+class ClientTMDB:
+    """Client TMDB avec pool de connexions partagé et requêtes concurrentes.
+
+    Un seul appel `/movie/{id}?append_to_response=credits,videos` remplace les
+    appels séparés au film, aux crédits et aux vidéos. La session `requests`
+    réutilise les connexions ; les erreurs transitoires (429, 5xx, coupures)
+    sont relancées avec une attente exponentielle.
+    Avec un `cache` (voir cache_tmdb.CacheTMDB), les réponses et les 404 sont
+    conservées ; une entrée périmée est servie telle quelle et rafraîchie en
+    arrière-plan.
+    """
+
+    def __init__(self, api_key, url_base=URL_API_TMDB, langue="fr", timeout=(3.05, 10),
+                 nb_essais=3, facteur_attente=0.5, nb_workers=8, cache=None):
+        self.api_key = api_key
+        self.url_base = url_base.rstrip("/")
+        self.langue = langue
+        self.timeout = timeout
+        self.nb_workers = nb_workers
+        self.cache = cache
+        self._en_rafraichissement = set()
+        self._verrou = threading.Lock()
+
+        relances = Retry(
+            total=nb_essais,
+            backoff_factor=facteur_attente,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adaptateur = HTTPAdapter(pool_connections=nb_workers, pool_maxsize=nb_workers, max_retries=relances)
+        self.session = requests.Session()
+        self.session.mount("https://", adaptateur)
+        self.session.mount("http://", adaptateur)
+        self.executeur = ThreadPoolExecutor(max_workers=nb_workers, thread_name_prefix="tmdb")
+
+    # Appel réseau pour un film (crédits et vidéos inclus), résultat enregistré dans le cache
+    def _telecharger_film(self, film_id):
+        compter("decodex_tmdb_appels_total")
+        try:
+            with etape("tmdb_appel"):
+                response = self.session.get(
+                    f"{self.url_base}/movie/{film_id}",
+                    params={"api_key": self.api_key, "language": self.langue, "append_to_response": "credits,videos"},
+                    timeout=self.timeout,
+                )
+        except requests.RequestException:
+            compter("decodex_tmdb_erreurs_total", statut="reseau")
+            raise
+        # Relances effectuées par urllib3 avant la réponse finale (429, 5xx, coupures)
+        relances = getattr(response.raw, "retries", None)
+        if relances is not None and relances.history:
+            compter("decodex_tmdb_relances_total", len(relances.history))
+        if response.status_code != 200:
+            compter("decodex_tmdb_erreurs_total", statut=response.status_code)
+        if response.status_code == 404:
+            if self.cache is not None:
+                self.cache.ecrire(film_id, self.langue, None, statut=404)
+            raise FilmIntrouvable(f"Erreur TMDB (film): {response.status_code}")
+        if response.status_code != 200:
+            raise ValueError(f"Erreur TMDB (film): {response.status_code}")
+        data = response.json()
+        if self.cache is not None:
+            self.cache.ecrire(film_id, self.langue, data)
+        return data
+
+    # Rafraîchissement en arrière-plan d'une entrée périmée (une seule requête à la fois par film)
+    def _rafraichir(self, film_id):
+        with self._verrou:
+            if film_id in self._en_rafraichissement:
+                return
+            self._en_rafraichissement.add(film_id)
+
+        def tache():
+            try:
+                self._telecharger_film(film_id)
+            except Exception:
+                pass  # L'entrée périmée reste servie jusqu'au prochain essai
+            finally:
+                with self._verrou:
+                    self._en_rafraichissement.discard(film_id)
+
+        self.executeur.submit(tache)
+
+    # Réponse brute de TMDB pour un film (crédits et vidéos inclus), via le cache s'il existe
+    def obtenir_film(self, film_id):
+        if not self.api_key:
+            raise ValueError("Clé API manquante")
+        if identifiant_manquant(film_id):
+            raise FilmIntrouvable("Identifiant TMDB manquant")
+        if self.cache is None:
+            return self._telecharger_film(film_id)
+
+        entree, etat = self.cache.lire(film_id, self.langue)
+        compter("decodex_tmdb_cache_total", etat=etat)
+        if etat == ABSENT:
+            return self._telecharger_film(film_id)
+        if etat == PERIME:
+            self._rafraichir(film_id)
+        if entree.negative:
+            raise FilmIntrouvable(f"Erreur TMDB (film): {entree.statut}")
+        return entree.donnees
+
+    # (détails, disponible) d'un film : en cas d'erreur, détails par défaut et disponible=False,
+    # pour que l'appelant ne conserve pas un résultat d'échec comme s'il s'agissait des vrais détails
+    def details_disponibles(self, film_id):
+        try:
+            return extraire_details(self.obtenir_film(film_id)), True
+        except Exception as e:
+            return details_par_defaut(e), False
+
+    # Détails affichés d'un film ; les erreurs sont converties en détails par défaut
+    def details(self, film_id):
+        return self.details_disponibles(film_id)[0]
+
+    # Détails de plusieurs films récupérés en parallèle, dans l'ordre des identifiants
+    # (`disponibles` : couples (détails, disponible) comme details_disponibles)
+    def details_lot(self, film_ids, disponibles=False):
+        with etape("tmdb_details"):
+            resultats = list(self.executeur.map(self.details_disponibles, film_ids))
+        return resultats if disponibles else [details for details, _ in resultats]
+
+    # Détails de plusieurs films au fil de leur arrivée : (position, détails, disponible)
+    def details_au_fil(self, film_ids):
+        futures = {self.executeur.submit(self.details_disponibles, film_id): i for i, film_id in enumerate(film_ids)}
+        for future in as_completed(futures):
+            yield (futures[future], *future.result())
+
+    def fermer(self):
+        self.executeur.shutdown(wait=False)
+        self.session.close()